@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth_utils import ACCESS_TOKEN_EXPIRE_MINUTES
+from database import AsyncSessionLocal
+from models import AuthSession, User
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+# Как часто воркер перечитывает отозванные сессии; столько другие воркеры
+# могут принимать токены доступа отозванной сессии
+SESSION_SYNC_SECONDS = int(os.getenv("SESSION_SYNC_SECONDS", "30"))
+# Истекшие сессии удаляются раз в час
+SESSION_PURGE_SECONDS = 3600
+
+
+class InvalidRefreshToken(Exception):
+    """Refresh-токен неизвестен, истек, отозван или уже обменян"""
+
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class RevokedSessions:
+    """Отозванные сессии, токены доступа которых еще не истекли.
+
+    Токен доступа живет ACCESS_TOKEN_EXPIRE_MINUTES, поэтому в памяти держатся
+    только сессии, отозванные за это время: проверка токена — поиск в словаре.
+    """
+
+    def __init__(self):
+        # family_id -> время отзыва (time.time())
+        self._revoked: Dict[str, float] = {}
+
+    def __contains__(self, family_id: Optional[str]) -> bool:
+        return family_id is not None and family_id in self._revoked
+
+    def add(self, family_ids: Iterable[str]) -> None:
+        # Отзыв в этом воркере виден сразу, не дожидаясь синхронизации
+        now = time.time()
+        for family_id in family_ids:
+            self._revoked.setdefault(family_id, now)
+
+    async def refresh(self) -> None:
+        cutoff = time.time() - ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(AuthSession.family_id)
+                .where(AuthSession.revoked_at >= datetime.fromtimestamp(cutoff, timezone.utc))
+                .distinct()
+            )
+            families = result.scalars().all()
+        # Отзыв, сделанный во время запроса, не теряется; старые записи вытесняются
+        revoked = {family_id: at for family_id, at in self._revoked.items() if at >= cutoff}
+        now = time.time()
+        for family_id in families:
+            revoked.setdefault(family_id, now)
+        self._revoked = revoked
+
+
+revoked_sessions = RevokedSessions()
+
+
+def create_session(db: AsyncSession, user_id: int, family_id: Optional[str] = None) -> Tuple[str, str]:
+    """Новый refresh-токен; сохраняется вместе с транзакцией вызывающего кода"""
+    token = secrets.token_urlsafe(32)
+    family_id = family_id or secrets.token_hex(16)
+    db.add(AuthSession(
+        user_id=user_id,
+        family_id=family_id,
+        token_hash=_hash_token(token),
+        expires_at=datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token, family_id
+
+
+async def revoke_family(db: AsyncSession, family_id: str) -> List[str]:
+    await db.execute(
+        update(AuthSession)
+        .where(AuthSession.family_id == family_id, AuthSession.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    return [family_id]
+
+
+async def revoke_user_sessions(db: AsyncSession, user_id: int) -> List[str]:
+    """Отзывает все сессии пользователя; возвращает их идентификаторы для revoked_sessions.add"""
+    result = await db.execute(
+        update(AuthSession)
+        .where(AuthSession.user_id == user_id, AuthSession.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(timezone.utc))
+        .returning(AuthSession.family_id)
+        .execution_options(synchronize_session=False)
+    )
+    return list(set(result.scalars().all()))
+
+
+async def rotate_session(db: AsyncSession, refresh_token: str) -> Tuple[User, str, str]:
+    """Обменивает refresh-токен на новый в той же сессии.
+
+    Повторное предъявление уже обмененного токена означает, что им пользуется
+    кто-то еще, поэтому отзывается вся сессия (обе ветки цепочки).
+    """
+    token_hash = _hash_token(refresh_token)
+    now = datetime.now(timezone.utc)
+    # Условие в UPDATE не дает обменять один токен дважды при параллельных запросах
+    result = await db.execute(
+        update(AuthSession)
+        .where(
+            AuthSession.token_hash == token_hash,
+            AuthSession.rotated_at.is_(None),
+            AuthSession.revoked_at.is_(None),
+            AuthSession.expires_at > now,
+        )
+        .values(rotated_at=now)
+        .returning(AuthSession.user_id, AuthSession.family_id)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    if row is None:
+        result = await db.execute(
+            select(AuthSession.family_id, AuthSession.rotated_at, AuthSession.revoked_at)
+            .where(AuthSession.token_hash == token_hash)
+        )
+        stale = result.first()
+        if stale is not None and stale.rotated_at is not None and stale.revoked_at is None:
+            logger.warning("Повторное использование refresh-токена, сессия отозвана",
+                           extra={"family_id": stale.family_id})
+            families = await revoke_family(db, stale.family_id)
+            await db.commit()
+            revoked_sessions.add(families)
+        raise InvalidRefreshToken()
+
+    result = await db.execute(select(User).where(User.id == row.user_id))
+    user = result.scalar_one_or_none()
+    if user is None:
+        raise InvalidRefreshToken()
+    token, family_id = create_session(db, user.id, row.family_id)
+    await db.commit()
+    return user, token, family_id
+
+
+async def find_family(db: AsyncSession, refresh_token: str) -> Optional[str]:
+    result = await db.execute(
+        select(AuthSession.family_id).where(AuthSession.token_hash == _hash_token(refresh_token))
+    )
+    return result.scalar_one_or_none()
+
+
+async def purge_sessions(now: Optional[datetime] = None) -> int:
+    """Удаляет сессии с истекшим refresh-токеном"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            delete(AuthSession).where(AuthSession.expires_at < (now or datetime.now(timezone.utc)))
+        )
+        await session.commit()
+    return result.rowcount
+
+
+async def run_session_maintenance(interval: int = SESSION_SYNC_SECONDS):
+    # Фоновая задача, запускаемая из lifespan приложения
+    last_purge = 0.0
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await revoked_sessions.refresh()
+            if time.monotonic() - last_purge >= SESSION_PURGE_SECONDS:
+                last_purge = time.monotonic()
+                purged = await purge_sessions()
+                if purged:
+                    logger.info("Удалено истекших сессий: %d", purged)
+        except Exception:
+            logger.exception("Ошибка синхронизации сессий")
@@ -1,8 +1,13 @@
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+import asyncio
+import hashlib
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,21 +15,104 @@ load_dotenv()
 # Секретный ключ для подписи JWT (НИКОГДА не публикуйте в коде!)
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 часа
+# Токен доступа живет недолго: продлевается обменом refresh-токена (POST /auth/refresh)
+# без повторной проверки пароля
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+
+# Чтение без обращения к кэшу пользователей и БД: пользователь и роль берутся из токена,
+# отзыв проверяется по версиям токенов в памяти (token_versions.py)
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "false").lower() == "true"
+# Сколько декодированных токенов хранится, чтобы не проверять подпись при каждом запросе
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
+# Параметры Argon2. При их изменении хеши пересчитываются при следующем входе
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "102400"))  # в КиБ
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "8"))
+
+# Пул для хеширования: thread или process, число воркеров и размер очереди
+HASH_POOL_KIND = os.getenv("HASH_POOL_KIND", "thread")
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(os.cpu_count() or 2)))
+HASH_POOL_MAX_PENDING = int(os.getenv("HASH_POOL_MAX_PENDING", "64"))
 
 # Контекст для хеширования паролей
 #pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    # Возвращает новый хеш, если старый создан с другими параметрами
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+class HashingPoolBusy(Exception):
+    """Очередь на хеширование переполнена"""
+
+
+class HashingPool:
+    """Выполняет хеширование вне event loop с ограничением числа ожидающих задач"""
+
+    def __init__(self, kind: str, workers: int, max_pending: int):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            elif self.kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="argon2")
+            else:
+                raise RuntimeError(f"Неизвестный HASH_POOL_KIND: {self.kind}")
+        return self._executor
+
+    async def run(self, func, *args):
+        if self.pending >= self.max_pending:
+            raise HashingPoolBusy()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hashing_pool = HashingPool(HASH_POOL_KIND, HASH_POOL_WORKERS, HASH_POOL_MAX_PENDING)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await hashing_pool.run(verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await hashing_pool.run(verify_and_update_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await hashing_pool.run(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -36,9 +124,27 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
+# Ключ — SHA-256 токена: сами токены в памяти не хранятся
+_decoded_tokens: "OrderedDict[bytes, dict]" = OrderedDict()
+
+
 def decode_access_token(token: str) -> Optional[dict]:
+    key = hashlib.sha256(token.encode()).digest()
+    payload = _decoded_tokens.get(key)
+    if payload is not None:
+        # Подпись уже проверена, остается срок действия
+        if payload["exp"] <= time.time():
+            del _decoded_tokens[key]
+            return None
+        _decoded_tokens.move_to_end(key)
+        return payload
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
-        return None
\ No newline at end of file
+        return None
+    if "exp" in payload:
+        _decoded_tokens[key] = payload
+        if len(_decoded_tokens) > TOKEN_CACHE_MAX_ENTRIES:
+            _decoded_tokens.popitem(last=False)
+    return payload
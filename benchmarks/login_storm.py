@@ -0,0 +1,85 @@
+"""
+Задержка GET /tasks во время массового входа пользователей.
+
+Запуск (сервер должен быть запущен, нужен пакет httpx):
+    python benchmarks/login_storm.py --base-url http://localhost:8000 --logins 200 --concurrency 50
+
+Скрипт регистрирует тестового пользователя, затем параллельно выполняет
+поток запросов /auth/login и опрашивает /tasks, измеряя задержку опроса.
+Сравнение с --logins 0 показывает, насколько вход блокирует остальные запросы.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(p * (len(ordered) - 1)))]
+
+
+async def login_storm(client, email, password, logins, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+
+    async def login():
+        async with semaphore:
+            r = await client.post("/auth/login", data={"username": email, "password": password})
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+    await asyncio.gather(*[login() for _ in range(logins)])
+    return statuses
+
+
+async def poll_tasks(client, headers, stop: asyncio.Event):
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        r = await client.get("/tasks", headers=headers)
+        r.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.base_url.rstrip("/") + "/api/v3", timeout=60) as client:
+        nickname = f"bench_{uuid.uuid4().hex[:8]}"
+        email, password = f"{nickname}@example.com", "benchmark-password"
+        r = await client.post("/auth/register", json={"nickname": nickname, "email": email, "password": password})
+        r.raise_for_status()
+        r = await client.post("/auth/login", data={"username": email, "password": password})
+        r.raise_for_status()
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        stop = asyncio.Event()
+        pollers = [asyncio.create_task(poll_tasks(client, headers, stop)) for _ in range(args.pollers)]
+        started = time.perf_counter()
+        if args.logins:
+            statuses = await login_storm(client, email, password, args.logins, args.concurrency)
+        else:
+            await asyncio.sleep(args.idle_seconds)
+            statuses = {}
+        elapsed = time.perf_counter() - started
+        stop.set()
+        latencies = [value for values in await asyncio.gather(*pollers) for value in values]
+
+    print(f" Логинов: {args.logins} за {elapsed:.2f} с, статусы: {statuses}")
+    print(f" Запросов /tasks: {len(latencies)}")
+    if latencies:
+        print(f" /tasks p50: {statistics.median(latencies):.1f} мс")
+        print(f" /tasks p99: {percentile(latencies, 0.99):.1f} мс")
+        print(f" /tasks max: {max(latencies):.1f} мс")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Задержка /tasks во время массового входа")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--pollers", type=int, default=4)
+    parser.add_argument("--idle-seconds", type=float, default=5.0, help="Длительность замера при --logins 0")
+    asyncio.run(main(parser.parse_args()))
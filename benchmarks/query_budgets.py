@@ -0,0 +1,134 @@
+"""
+Проверка бюджета запросов к БД по маршрутам: защита от N+1 для CI.
+
+Запуск (нужны пакеты httpx и aiosqlite; БД по умолчанию — временный файл SQLite):
+    python benchmarks/query_budgets.py
+    python benchmarks/query_budgets.py --verbose
+
+Для каждого маршрута задано наибольшее допустимое число запросов к БД и сколько
+раз может повториться один и тот же запрос. Запросы считаются через
+metrics.count_queries, поэтому учитывается все, что выполнено в ходе HTTP-запроса,
+включая зависимости. Кэш пользователей прогревается заранее: бюджет описывает
+обычный запрос, а не первый запрос пользователя после запуска.
+
+Превышение бюджета — код выхода 1 и список выполненных запросов. Если маршрут
+стал делать меньше запросов, бюджет стоит уменьшить вместе с изменением.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_checks(token, admin_token, task_ids, prefix, notify=0):
+    """Проверки: имя, наибольшее число запросов, повторов одного запроса и функция -> (метод, путь, параметры)
+
+    notify — запрос pg_notify, которым изменения задач в PostgreSQL отправляют события
+    в своей транзакции.
+    """
+    auth = {"Authorization": f"Bearer {token}"}
+    admin = {"Authorization": f"Bearer {admin_token}"}
+    deadline = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+    # Списки и статистика — выборка плюс запрос ETag (count и max(updated_at))
+    return [
+        ("GET /tasks", 2, 1, lambda: ("GET", "/tasks", {"headers": auth})),
+        ("GET /tasks/quadrant/{q}", 2, 1, lambda: ("GET", "/tasks/quadrant/Q1", {"headers": auth})),
+        ("GET /tasks/today", 2, 1, lambda: ("GET", "/tasks/today", {"headers": auth})),
+        ("GET /tasks/search", 2, 1, lambda: ("GET", "/tasks/search", {"params": {"q": "задача"}, "headers": auth})),
+        ("GET /tasks/changes", 3, 1, lambda: ("GET", "/tasks/changes", {"headers": auth})),
+        ("GET /tasks/{id}", 1, 1, lambda: ("GET", f"/tasks/{task_ids[0]}", {"headers": auth})),
+        ("GET /tasks/export", 1, 1, lambda: ("GET", "/tasks/export", {"headers": auth})),
+        ("GET /stats/", 2, 1, lambda: ("GET", "/stats/", {"headers": auth})),
+        ("GET /stats/deadlines", 2, 1, lambda: ("GET", "/stats/deadlines", {"headers": auth})),
+        ("GET /stats/?by_user=true (admin)", 4, 1, lambda: ("GET", "/stats/", {"params": {"by_user": "true"}, "headers": admin})),
+        ("GET /auth/me", 0, 0, lambda: ("GET", "/auth/me", {"headers": auth})),
+        ("GET /auth/admin/users (admin)", 1, 1, lambda: ("GET", "/auth/admin/users", {"headers": admin})),
+        ("POST /tasks/", 1 + notify, 1, lambda: ("POST", "/tasks/", {"json": {"title": "Новая задача", "is_important": True, "deadline_at": deadline}, "headers": auth})),
+        ("PUT /tasks/{id}", 1 + notify, 1, lambda: ("PUT", f"/tasks/{task_ids[1]}", {"json": {"title": "Обновленная задача", "is_important": False}, "headers": auth})),
+        ("PATCH /tasks/{id}/complete", 1 + notify, 1, lambda: ("PATCH", f"/tasks/{task_ids[2]}/complete", {"headers": auth})),
+        ("DELETE /tasks/{id}", 2 + notify, 1, lambda: ("DELETE", f"/tasks/{task_ids[3]}", {"headers": auth})),
+        # Бюджет пакета не растет с его размером: одинаковые INSERT не должны повторяться
+        # (кроме SQLite, где INSERT ... RETURNING с порядком строк выполняется построчно)
+        ("POST /tasks/batch", 1 + notify, None, lambda: ("POST", "/tasks/batch", {"json": [{"title": f"Пакетная задача {k}", "is_important": k % 2 == 0} for k in range(20)], "headers": auth})),
+        # Пакетное изменение — один UPDATE ... SET поле = CASE id ... RETURNING
+        ("PATCH /tasks/batch", 1 + notify, 1, lambda: ("PATCH", "/tasks/batch", {"json": [{"id": task_id, "title": f"Пакетное изменение {task_id}", "is_important": task_id % 2 == 0} for task_id in task_ids[4:24]], "headers": auth})),
+        ("POST /auth/register", 2, 1, lambda: ("POST", "/auth/register", {"json": {"nickname": f"{prefix}_new", "email": f"{prefix}_new@example.com", "password": "budget-password"}})),
+    ]
+
+
+async def run(args):
+    import httpx
+
+    from api import seed
+    from database import engine
+    from main import app, lifespan
+    from metrics import QueryBudgetExceeded, assert_query_budget, count_queries
+
+    prefix = f"budget_{uuid.uuid4().hex[:8]}"
+    tokens, admin_token, _, task_ids = await seed(args, prefix)
+    notify = 1 if engine.dialect.name == "postgresql" else 0
+    checks = build_checks(tokens[0], admin_token, task_ids[0], prefix, notify)
+    if engine.dialect.name == "sqlite":
+        # См. комментарий к POST /tasks/batch: на SQLite ограничивается только общее число
+        checks = [
+            (name, 25 if name == "POST /tasks/batch" else budget, repeats, make_request)
+            for name, budget, repeats, make_request in checks
+        ]
+
+    failures = 0
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://budget/api/v3") as client:
+            for token in (tokens[0], admin_token):
+                await client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+            for name, budget, repeats, make_request in checks:
+                method, url, kwargs = make_request()
+                with count_queries() as stats:
+                    response = await client.request(method, url, **kwargs)
+                if response.status_code >= 400:
+                    failures += 1
+                    print(f" ОШИБКА {name}: HTTP {response.status_code}")
+                    continue
+                try:
+                    assert_query_budget(stats, budget, repeats)
+                except QueryBudgetExceeded as exc:
+                    failures += 1
+                    print(f" ПРЕВЫШЕН {name}: {exc}")
+                    continue
+                print(f" ok      {name:<36} запросов {stats.queries} из {budget}")
+                if args.verbose:
+                    for statement, count in stats.statements.items():
+                        print(f"           {count} x {' '.join(statement.split())[:120]}")
+    await engine.dispose()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка бюджета запросов к БД по маршрутам")
+    parser.add_argument("--database-url", help="По умолчанию — временная БД SQLite")
+    parser.add_argument("--users", type=int, default=2)
+    parser.add_argument("--tasks-per-user", type=int, default=50)
+    parser.add_argument("--verbose", action="store_true", help="Выводить выполненные запросы")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{directory}/budget.db"
+        os.environ.setdefault("LOG_LEVEL", "ERROR")
+        # Все запросы идут с одного адреса и от нескольких пользователей: ограничение
+        # частоты превратило бы замер в проверку лимитов
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+        failures = asyncio.run(run(args))
+
+    if failures:
+        print(f" Проверок не пройдено: {failures}")
+        sys.exit(1)
+    print(" Все маршруты в пределах бюджета")
+
+
+if __name__ == "__main__":
+    main()
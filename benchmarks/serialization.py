@@ -0,0 +1,98 @@
+"""
+Время выборки и сериализации списка задач: объекты ORM + Pydantic против строк + orjson.
+
+Запуск (нужен пакет aiosqlite, БД создается во временном файле):
+    python benchmarks/serialization.py --tasks 1000 --repeat 50
+
+Первый вариант повторяет прежний путь GET /tasks: загрузка объектов Task,
+проверка через TypeAdapter(List[TaskResponse]) и кодирование JSON.
+Второй — текущий: выборка только нужных столбцов, task_records и dump_json.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Модули приложения создают движок при импорте; сам замер использует отдельную БД
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from pydantic import TypeAdapter
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import Base, Task, User
+from schemas import TaskResponse
+from task_serializers import TASK_COLUMNS, task_records, dump_json, orjson
+
+
+async def prepare(session, tasks: int) -> None:
+    user = User(nickname="bench", email="bench@example.com", hashed_password="x")
+    session.add(user)
+    await session.flush()
+    now = datetime.now()
+    await session.execute(
+        insert(Task).execution_options(render_nulls=True),
+        [{
+            "title": f"Задача {i}",
+            "description": "Описание задачи" if i % 2 else None,
+            "is_important": i % 3 == 0,
+            "deadline_at": now + timedelta(days=i % 10) if i % 4 else None,
+            "quadrant": "Q2",
+            "completed": False,
+            "user_id": user.id,
+        } for i in range(tasks)]
+    )
+    await session.commit()
+
+
+async def orm_path(session) -> bytes:
+    tasks = (await session.execute(select(Task).order_by(Task.id))).scalars().all()
+    body = TypeAdapter(List[TaskResponse]).dump_json(tasks)
+    session.expunge_all()
+    return body
+
+
+async def rows_path(session) -> bytes:
+    rows = (await session.execute(select(*TASK_COLUMNS).order_by(Task.id))).all()
+    return dump_json(task_records(rows))
+
+
+async def measure(session_factory, path, repeat: int) -> List[float]:
+    timings = []
+    async with session_factory() as session:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await path(session)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{directory}/bench.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as session:
+            await prepare(session, args.tasks)
+
+        print(f" Задач: {args.tasks}, повторов: {args.repeat}, orjson: {'да' if orjson else 'нет'}")
+        for name, path in (("ORM + TypeAdapter", orm_path), ("строки + task_records", rows_path)):
+            # Прогрев: первый запрос компилирует SQL и строит валидаторы
+            await measure(session_factory, path, 1)
+            timings = await measure(session_factory, path, args.repeat)
+            print(f" {name:<24} медиана {statistics.median(timings):7.2f} мс, минимум {min(timings):7.2f} мс")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сравнение сериализации списка задач")
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
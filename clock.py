@@ -0,0 +1,86 @@
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, tzinfo
+from typing import Optional, Tuple, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from fastapi import Header, HTTPException, Query, status
+
+TIMEZONE_HEADER = "X-Timezone"
+
+
+@dataclass(frozen=True)
+class Clock:
+    """Момент времени в часовом поясе клиента, общий для всего запроса"""
+    now: datetime
+
+    @property
+    def tz(self) -> tzinfo:
+        return self.now.tzinfo
+
+    @property
+    def today(self) -> date:
+        return self.now.date()
+
+    @property
+    def key(self) -> str:
+        # Для ключей кэша и ETag: даты в ответе зависят от дня и часового пояса
+        return f"{self.today.isoformat()} {self.tz}"
+
+    def local_date(self, value: Union[datetime, date]) -> date:
+        if not isinstance(value, datetime):
+            return value
+        # Дата дедлайна определяется в часовом поясе клиента; значения без пояса
+        # (SQLite) считаются уже записанными в местном времени
+        if value.tzinfo is not None:
+            value = value.astimezone(self.tz)
+        return value.date()
+
+    def days_until(self, value: Optional[Union[datetime, date]]) -> Optional[int]:
+        if value is None:
+            return None
+        return (self.local_date(value) - self.today).days
+
+    def today_window(self) -> Tuple[datetime, datetime]:
+        """Начало сегодняшнего и завтрашнего дня"""
+        start = datetime.combine(self.today, time.min, tzinfo=self.tz)
+        end = datetime.combine(self.today + timedelta(days=1), time.min, tzinfo=self.tz)
+        return start, end
+
+
+def resolve_timezone(tz: Optional[str]) -> Optional[tzinfo]:
+    # None — локальный пояс сервера
+    if tz is None:
+        return None
+    try:
+        return ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Неизвестный часовой пояс"
+        )
+
+
+def make_clock(tz: Optional[tzinfo] = None) -> Clock:
+    return Clock(datetime.now(tz) if tz is not None else datetime.now().astimezone())
+
+
+_request_clock: ContextVar[Optional[Clock]] = ContextVar("request_clock", default=None)
+
+
+def current_clock() -> Clock:
+    """Часы текущего запроса; вне запроса (планировщик, CLI) — время сервера"""
+    clock = _request_clock.get()
+    return clock if clock is not None else make_clock()
+
+
+# Зависимость FastAPI: часы фиксируются один раз при разборе запроса
+async def get_request_clock(
+    tz: Optional[str] = Query(None, description="Часовой пояс, например Europe/Moscow"),
+    x_timezone: Optional[str] = Header(None, alias=TIMEZONE_HEADER),
+) -> Clock:
+    clock = make_clock(resolve_timezone(tz or x_timezone))
+    # Асинхронная зависимость выполняется в контексте запроса, поэтому
+    # значение видно обработчику и свойствам моделей
+    _request_clock.set(clock)
+    return clock
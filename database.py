@@ -1,8 +1,17 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase 
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util import LRUCache
+from sqlalchemy import event, inspect, text
+from sqlalchemy.schema import CreateColumn
 from typing import AsyncGenerator
+from uuid import uuid4
 import os
+import logging
+import time
 from dotenv import load_dotenv
+from metrics import registry, db_pool_checkout_wait_seconds, instrument_engine
 try:
     from models import Base, Task
 except ImportError:
@@ -10,24 +19,185 @@ except ImportError:
         pass
 
 load_dotenv()
+
+logger = logging.getLogger(__name__)
 DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_async_engine(
-    DATABASE_URL,
-    connect_args={"statement_cache_size": 0}
-)
+
+# Настройки пула соединений
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # секунды
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # ожидание свободного соединения
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "60"))  # выполнение запроса
+
+# Кэш подготовленных выражений asyncpg:
+#   session — прямое подключение или pooler в режиме session;
+#   unique  — transaction pooler, который сам переносит подготовленные выражения
+#             между серверными соединениями (pgbouncer >= 1.21 с max_prepared_statements):
+#             уникальные имена выражений;
+#   off     — кэш выключен;
+#   auto    — off для порта 6543 (transaction pooler Supabase), иначе session
+DB_STATEMENT_CACHE = os.getenv("DB_STATEMENT_CACHE", "auto")
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+TRANSACTION_POOLER_PORT = 6543
+
+# Время ожидания соединения из пула и попадания в кэш выражений
+pool_metrics = {
+    "checkouts": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+}
+statement_cache_metrics = {
+    "hits": 0,
+    "misses": 0,
+}
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, измеряющий время ожидания свободного соединения"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            pool_metrics["checkouts"] += 1
+            pool_metrics["wait_seconds_total"] += waited
+            pool_metrics["wait_seconds_max"] = max(pool_metrics["wait_seconds_max"], waited)
+            db_pool_checkout_wait_seconds.observe(waited)
+
+
+class CountingStatementCache(LRUCache):
+    """LRU-кэш подготовленных выражений с подсчетом попаданий"""
+
+    def __contains__(self, key):
+        found = super().__contains__(key)
+        statement_cache_metrics["hits" if found else "misses"] += 1
+        return found
+
+
+def _statement_cache_mode(url) -> str:
+    if DB_STATEMENT_CACHE != "auto":
+        return DB_STATEMENT_CACHE
+    # Уникальные имена лишь исключают конфликты: выражение из кэша может попасть на другое
+    # серверное соединение, где оно не подготовлено, поэтому для pooler'а кэш выключается
+    return "off" if url.port == TRANSACTION_POOLER_PORT else "session"
+
+
+def _engine_options(database_url: str) -> dict:
+    url = make_url(database_url)
+    if url.get_backend_name() != "postgresql":
+        # SQLite и другие БД (например, для тестов) — настройки по умолчанию
+        return {}
+
+    options = {
+        "poolclass": TimedAsyncAdaptedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    if url.get_driver_name() != "asyncpg":
+        return options
+
+    mode = _statement_cache_mode(url)
+    # Собственный кэш asyncpg не используется SQLAlchemy и для pooler'ов должен быть выключен
+    connect_args = {"command_timeout": DB_COMMAND_TIMEOUT, "statement_cache_size": 0}
+    if mode == "off":
+        connect_args["prepared_statement_cache_size"] = 0
+    elif mode in ("session", "unique"):
+        connect_args["prepared_statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
+        if mode == "unique":
+            # Уникальные имена не конфликтуют на общих серверных соединениях pooler'а
+            connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    else:
+        raise RuntimeError(f"Неизвестный DB_STATEMENT_CACHE: {DB_STATEMENT_CACHE}")
+    options["connect_args"] = connect_args
+    return options
+
+
+engine = create_async_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+# Счетчики и время запросов, журнал медленных запросов (GET /metrics)
+instrument_engine(engine)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _count_statement_cache(dbapi_connection, connection_record):
+    # Подменяем LRU-кэш адаптера asyncpg на кэш с подсчетом попаданий
+    cache = getattr(dbapi_connection, "_prepared_statement_cache", None)
+    if isinstance(cache, LRUCache) and not isinstance(cache, CountingStatementCache):
+        dbapi_connection._prepared_statement_cache = CountingStatementCache(cache.capacity)
+
+
+def get_pool_metrics() -> dict:
+    pool = engine.sync_engine.pool
+    checkouts = pool_metrics["checkouts"]
+    lookups = statement_cache_metrics["hits"] + statement_cache_metrics["misses"]
+    return {
+        "pool": {
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            "checkouts": checkouts,
+            "avg_wait_ms": pool_metrics["wait_seconds_total"] / checkouts * 1000 if checkouts else 0.0,
+            "max_wait_ms": pool_metrics["wait_seconds_max"] * 1000,
+        },
+        "statement_cache": {
+            "hits": statement_cache_metrics["hits"],
+            "misses": statement_cache_metrics["misses"],
+            "hit_rate": statement_cache_metrics["hits"] / lookups if lookups else 0.0,
+        },
+    }
+
+
+def _pool_gauge(method: str):
+    # Значение читается из пула при каждом запросе /metrics; у пула SQLite этих методов нет
+    def read() -> dict:
+        pool = engine.sync_engine.pool
+        return {(): getattr(pool, method)()} if hasattr(pool, method) else {}
+    return read
+
+
+registry.gauge("db_pool_size", "Размер пула соединений", function=_pool_gauge("size"))
+registry.gauge("db_pool_checked_out", "Соединения, выданные из пула", function=_pool_gauge("checkedout"))
+registry.gauge("db_pool_overflow", "Соединения сверх размера пула", function=_pool_gauge("overflow"))
+
+
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
     autoflush=False,
     expire_on_commit=False
 )
+def _add_missing_columns(sync_conn):
+    # create_all не добавляет новые столбцы (например, tasks.updated_at) в уже существующие таблицы
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_ddl = CreateColumn(column).compile(dialect=sync_conn.dialect)
+                sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+def _create_missing_indexes(sync_conn):
+    # create_all не добавляет новые индексы в уже существующие таблицы
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-        print("База данных инициализирована!")
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
+        logger.info("База данных инициализирована")
 async def drop_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
-        print("Все таблицы удалены!")
+        logger.info("Все таблицы удалены")
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         yield session
\ No newline at end of file
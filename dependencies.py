@@ -4,45 +4,90 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from database import get_async_session
 from models import User, UserRole
-from auth_utils import decode_access_token
+from auth_utils import AUTH_STATELESS, decode_access_token
+from auth_sessions import revoked_sessions
+from token_versions import token_versions
+from user_cache import user_cache
 from typing import Optional
 
 # OAuth2 схема для получения токена из заголовка Authorization
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v3/auth/login")
 
 
-# Аутентификация
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_async_session)
-) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Не удалось проверить учетные данные",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
+# Пользователь по токену доступа; None, если токен недействителен
+async def authenticate_token(token: str, db: AsyncSession) -> Optional[User]:
     # Декодирование токена
     payload = decode_access_token(token)
-    if payload is None:
-        raise credentials_exception
+    if payload is None or payload.get("sid") in revoked_sessions:
+        return None
     
     user_id: Optional[int] = payload.get("sub")
     if user_id is None:
-        raise credentials_exception
+        return None
     
-    # Поиск пользователя в БД
+    # Сначала ищем пользователя в кэше, затем в БД
+    user = await user_cache.get(int(user_id))
+    if user is not None:
+        return user if _token_version_matches(payload, user) else None
+
     result = await db.execute(
         select(User).where(User.id == int(user_id))
     )
     user = result.scalar_one_or_none()
     
+    if user is not None:
+        await user_cache.set(user)
+    return user if _token_version_matches(payload, user) else None
+
+
+def _token_version_matches(payload: dict, user: Optional[User]) -> bool:
+    # Токены, выданные до появления версий, считаются токенами версии 0
+    return user is not None and payload.get("tv", 0) == user.token_version
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Не удалось проверить учетные данные",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+# Аутентификация
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_session)
+) -> User:
+    user = await authenticate_token(token, db)
     if user is None:
-        raise credentials_exception
-    
+        raise _credentials_exception()
     return user
 
 
+# Аутентификация для чтения: при AUTH_STATELESS=true пользователь берется из токена.
+# У такого объекта заполнены только id, role и token_version
+async def get_token_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_session)
+) -> User:
+    if not AUTH_STATELESS or not token_versions.loaded:
+        return await get_current_user(token, db)
+
+    payload = decode_access_token(token)
+    if payload is None or payload.get("sid") in revoked_sessions:
+        raise _credentials_exception()
+    if "role" not in payload or "tv" not in payload:
+        # Токен старого формата — проверка через кэш пользователей и БД
+        return await get_current_user(token, db)
+
+    user_id = int(payload["sub"])
+    # Роль в токене действительна до его истечения; при смене роли
+    # нужно увеличить token_version, чтобы отозвать выданные токены
+    if payload["tv"] != token_versions.get(user_id):
+        raise _credentials_exception()
+    return User(id=user_id, role=UserRole(payload["role"]), token_version=payload["tv"])
+
+
 # Авторизация, возвращает объект User, если пользователь является администратором
 async def get_current_admin(
     current_user: User = Depends(get_current_user)
@@ -0,0 +1,79 @@
+import hashlib
+import json
+from typing import Awaitable, Callable, Optional
+
+from fastapi import Request, Response, status
+
+from models.user import User
+from response_cache import response_cache, CachedBody
+from task_serializers import dump_json
+
+ETAG_HEADER = "ETag"
+# Ответ можно хранить только в кэше клиента и перед использованием нужно перепроверить
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Сильный ETag из произвольных JSON-совместимых значений"""
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return '"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Для If-None-Match используется слабое сравнение: префикс W/ не учитывается
+    candidates = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return etag in candidates
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={ETAG_HEADER: etag, "Cache-Control": CACHE_CONTROL}
+    )
+
+
+def user_scope(current_user: User) -> str:
+    return "admin" if current_user.role.value == "admin" else f"user:{current_user.id}"
+
+
+async def conditional_json_response(
+    request: Request,
+    current_user: User,
+    endpoint: str,
+    params: dict,
+    fingerprint: Callable[[], Awaitable[tuple]],
+    produce: Callable[[], Awaitable[CachedBody]],
+) -> Response:
+    """Ответ из кэша или БД с ETag и обработкой If-None-Match.
+
+    fingerprint — дешевый агрегирующий запрос (количество строк и max(updated_at)),
+    по которому ETag вычисляется без загрузки и сериализации тела ответа.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    key = await response_cache.key_for(current_user, endpoint, params)
+    cached = await response_cache.lookup(key)
+    if cached is not None:
+        body, headers = cached
+    else:
+        # Отпечаток снимается до основного запроса: если данные изменятся между
+        # запросами, ETag окажется старше тела и клиент получит полный ответ еще раз
+        etag = make_etag(endpoint, params, user_scope(current_user), await fingerprint())
+        if etag_matches(if_none_match, etag):
+            return not_modified_response(etag)
+        body, headers = await produce()
+        # В кэше хранится уже закодированный JSON: при попадании тело не сериализуется заново
+        body = dump_json(body).decode("utf-8")
+        headers = {**headers, ETAG_HEADER: etag}
+        await response_cache.store(key, body, headers)
+
+    if etag_matches(if_none_match, headers.get(ETAG_HEADER)):
+        return not_modified_response(headers[ETAG_HEADER])
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={**headers, "Cache-Control": CACHE_CONTROL}
+    )
@@ -4,12 +4,52 @@ function getAuthToken() {
     return localStorage.getItem('token');
 }
 
-function setAuthToken(token) {
+function getRefreshToken() {
+    return localStorage.getItem('refreshToken');
+}
+
+function setAuthToken(token, refreshToken) {
     localStorage.setItem('token', token);
+    if (refreshToken) {
+        localStorage.setItem('refreshToken', refreshToken);
+    }
 }
 
 function clearAuthToken() {
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
+}
+
+// Один обмен refresh-токена на все запросы, получившие 401 одновременно:
+// повторно предъявленный refresh-токен сервер считает украденным
+let refreshPromise = null;
+
+function refreshAccessToken() {
+    const refreshToken = getRefreshToken();
+    if (!refreshToken) {
+        return Promise.resolve(false);
+    }
+    if (!refreshPromise) {
+        refreshPromise = fetch(`${API_BASE_URL}/auth/refresh`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ refresh_token: refreshToken }),
+        })
+            .then(async (response) => {
+                if (!response.ok) {
+                    clearAuthToken();
+                    return false;
+                }
+                const data = await response.json();
+                setAuthToken(data.access_token, data.refresh_token);
+                return true;
+            })
+            .catch(() => false)
+            .finally(() => {
+                refreshPromise = null;
+            });
+    }
+    return refreshPromise;
 }
 
 async function apiRequest(endpoint, options = {}) {
@@ -37,6 +77,13 @@ async function apiRequest(endpoint, options = {}) {
         
         console.log('API Response:', { url, status: response.status, ok: response.ok });
         
+        // Токен доступа истек — продлеваем его и повторяем запрос один раз
+        if (response.status === 401 && token && !options.skipAuth && !options.retried) {
+            if (await refreshAccessToken()) {
+                return await apiRequest(endpoint, { ...options, retried: true });
+            }
+        }
+        
         if (!response.ok) {
             const errorData = await response.json().catch(() => ({}));
             console.error('API Error:', errorData);
@@ -44,11 +91,15 @@ async function apiRequest(endpoint, options = {}) {
         }
         
         const contentType = response.headers.get('content-type');
+        let data = null;
         if (contentType && contentType.includes('application/json')) {
-            return await response.json();
+            data = await response.json();
         }
         
-        return null;
+        if (options.withHeaders) {
+            return { data, headers: response.headers };
+        }
+        return data;
     } catch (error) {
         console.error('API request failed:', { url, error: error.message });
         if (error.message === 'Failed to fetch') {
@@ -82,6 +133,18 @@ export const authAPI = {
         });
     },
     
+    async logout() {
+        const refreshToken = getRefreshToken();
+        if (!refreshToken) {
+            return null;
+        }
+        return await apiRequest('/auth/logout', {
+            method: 'POST',
+            body: JSON.stringify({ refresh_token: refreshToken }),
+            skipAuth: true,
+        });
+    },
+    
     async getMe() {
         return await apiRequest('/auth/me', {
             method: 'GET',
@@ -89,21 +152,37 @@ export const authAPI = {
     },
     
     async changePassword(oldPassword, newPassword) {
-        return await apiRequest('/auth/change-password', {
+        const data = await apiRequest('/auth/change-password', {
             method: 'PATCH',
             body: JSON.stringify({
                 old_password: oldPassword,
                 new_password: newPassword,
             }),
         });
+        // Смена пароля отзывает все сессии, включая текущую: сохраняем выданную новую
+        setAuthToken(data.access_token, data.refresh_token);
+        return data;
     },
 };
 
 export const tasksAPI = {
     async getAll() {
-        return await apiRequest('/tasks', {
-            method: 'GET',
-        });
+        // Список отдается страницами, курсор следующей страницы приходит в X-Next-Cursor
+        const tasks = [];
+        let cursor = null;
+        do {
+            const params = new URLSearchParams({ limit: '500' });
+            if (cursor) {
+                params.set('cursor', cursor);
+            }
+            const { data, headers } = await apiRequest(`/tasks?${params}`, {
+                method: 'GET',
+                withHeaders: true,
+            });
+            tasks.push(...data);
+            cursor = headers.get('X-Next-Cursor');
+        } while (cursor);
+        return tasks;
     },
     
     async getById(taskId) {
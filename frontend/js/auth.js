@@ -59,7 +59,7 @@ export class AuthManager {
         try {
             this.showLoading(true);
             const response = await authAPI.login(email, password);
-            setAuthToken(response.access_token);
+            setAuthToken(response.access_token, response.refresh_token);
             
             await this.loadCurrentUser();
             
@@ -94,7 +94,7 @@ export class AuthManager {
             await authAPI.register({ nickname, email, password });
             
             const loginResponse = await authAPI.login(email, password);
-            setAuthToken(loginResponse.access_token);
+            setAuthToken(loginResponse.access_token, loginResponse.refresh_token);
             
             await this.loadCurrentUser();
             
@@ -118,6 +118,8 @@ export class AuthManager {
     }
     
     logout() {
+        // Сессия завершается и на сервере; ответ не ждем
+        authAPI.logout().catch(() => {});
         clearAuthToken();
         this.currentUser = null;
         window.dispatchEvent(new CustomEvent('auth:logout'));
@@ -0,0 +1,61 @@
+"""
+Импорт задач из файла NDJSON или CSV напрямую в БД.
+
+Запуск:
+    python import_tasks.py tasks.ndjson --email user@example.com
+    python import_tasks.py tasks.csv --user-id 42
+
+Формат определяется по расширению файла (или параметром --format).
+Строки с ошибками пропускаются и выводятся в отчете.
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select
+
+from database import AsyncSessionLocal, engine
+from models import User
+from task_events import notify_tasks_imported
+from task_import import IMPORT_FORMATS, import_tasks, open_text_stream
+
+
+async def main(args):
+    import_format = args.format or args.path.rsplit(".", 1)[-1].lower()
+    if import_format not in IMPORT_FORMATS:
+        print(f" Неизвестный формат файла: {import_format}. Используйте --format ndjson или csv")
+        return
+
+    try:
+        async with AsyncSessionLocal() as session:
+            query = select(User.id)
+            query = query.where(User.email == args.email) if args.email else query.where(User.id == args.user_id)
+            user_id = (await session.execute(query)).scalar_one_or_none()
+            if user_id is None:
+                print(" Пользователь не найден")
+                return
+
+            started = time.perf_counter()
+            with open(args.path, "rb") as binary:
+                result = await import_tasks(session, open_text_stream(binary), import_format, user_id)
+            elapsed = time.perf_counter() - started
+
+        if result["imported"]:
+            await notify_tasks_imported(engine, user_id)
+        print(f" Импортировано задач: {result['imported']} за {elapsed:.2f} с")
+        print(f" Строк с ошибками: {result['failed']}")
+        for error in result["errors"][:args.show_errors]:
+            print(f"  строка {error['line']}: {'; '.join(error['errors'])}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт задач из NDJSON или CSV")
+    parser.add_argument("path", help="Путь к файлу")
+    owner = parser.add_mutually_exclusive_group(required=True)
+    owner.add_argument("--email", help="Email владельца задач")
+    owner.add_argument("--user-id", type=int, help="Идентификатор владельца задач")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="Формат файла (по умолчанию — по расширению)")
+    parser.add_argument("--show-errors", type=int, default=20, help="Сколько ошибок вывести")
+    asyncio.run(main(parser.parse_args()))
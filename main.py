@@ -1,23 +1,65 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from database import init_db, get_async_session
+from database import init_db, get_async_session, engine, get_pool_metrics
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, text
-from routers import tasks, stats, auth
+from routers import tasks, stats, auth, events
+from quadrant_scheduler import run_quadrant_scheduler
+from task_sync import run_tombstone_compaction
+from token_versions import token_versions, run_token_version_refresh
+from auth_sessions import revoked_sessions, run_session_maintenance
+from task_events import event_hub, get_event_broker
+from user_cache import user_cache
+from response_cache import response_cache
+from auth_utils import hashing_pool, HashingPoolBusy
+from task_search import init_search
+from metrics import MetricsMiddleware, registry as metrics_registry
+from rate_limit import RateLimitMiddleware, RateLimitPolicy, parse_rate, RATE_LIMIT_AUTH, RATE_LIMIT_SEARCH, RATE_LIMIT_API
+from app_logging import RequestIdMiddleware, REQUEST_ID_HEADER, setup_logging, shutdown_logging
+import asyncio
+import contextlib
+import logging
+
+logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Код ДО yield выполняется при ЗАПУСКЕ
-    print(" Запуск приложения...")
-    print(" Инициализация базы данных...")
+    # Журнал пишется через очередь в отдельном потоке и не блокирует цикл событий
+    setup_logging()
+    logger.info("Запуск приложения")
+    logger.info("Инициализация базы данных")
     # Создаем таблицы (если их нет)
     await init_db()
-    print(" Приложение готово к работе!")
+    # Полнотекстовый индекс для поиска задач
+    await init_search(engine)
+    # Доставка событий об изменениях задач подписчикам SSE/WebSocket
+    event_broker = get_event_broker(engine)
+    await event_broker.start()
+    # Фоновый пересчет квадрантов по мере приближения дедлайнов
+    scheduler = asyncio.create_task(run_quadrant_scheduler())
+    # Очистка устаревших записей об удаленных задачах
+    compaction = asyncio.create_task(run_tombstone_compaction())
+    # Версии токенов для проверки отзыва без обращения к БД
+    await token_versions.refresh()
+    token_refresh = asyncio.create_task(run_token_version_refresh())
+    # Отозванные сессии для проверки токенов доступа и удаление истекших сессий
+    await revoked_sessions.refresh()
+    session_maintenance = asyncio.create_task(run_session_maintenance())
+    logger.info("Приложение готово к работе")
     yield  # Здесь приложение работает
 
     # Код ПОСЛЕ yield выполняется при ОСТАНОВКЕ
-    print(" Остановка приложения...")
+    logger.info("Остановка приложения")
+    for background_task in (scheduler, compaction, token_refresh, session_maintenance):
+        background_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await background_task
+    await event_broker.stop()
+    hashing_pool.shutdown()
+    shutdown_logging()
 
 app = FastAPI(
     title="ToDo лист API",
@@ -26,6 +68,21 @@ app = FastAPI(
     contact={"name": "Матвей"},
     lifespan=lifespan  # Подключаем lifespan
 )
+# Ограничение частоты запросов. Политики проверяются по порядку, применяется первая
+# подходящая: вход и регистрация (Argon2) — по IP, поиск (полный просмотр задач)
+# и остальные маршруты API — по пользователю
+app.add_middleware(
+    RateLimitMiddleware,
+    policies=[
+        RateLimitPolicy(
+            "auth", *parse_rate(RATE_LIMIT_AUTH), key="ip", methods=("POST",),
+            paths=("/api/v3/auth/login", "/api/v3/auth/register", "/api/v3/auth/refresh"),
+        ),
+        RateLimitPolicy("search", *parse_rate(RATE_LIMIT_SEARCH), paths=("/api/v3/tasks/search",)),
+        RateLimitPolicy("api", *parse_rate(RATE_LIMIT_API), paths=("/api/v3/",)),
+    ],
+)
+# CORS подключается после ограничения частоты, чтобы ответ 429 был доступен браузеру
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -39,11 +96,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Next-Cursor", "ETag", REQUEST_ID_HEADER,
+        "Retry-After", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "RateLimit-Policy",
+    ],
 )
+# Задержка, статусы и запросы к БД по маршрутам для GET /metrics
+app.add_middleware(MetricsMiddleware)
+# Идентификатор запроса для журнала; подключается последним, чтобы охватить все остальные middleware
+app.add_middleware(RequestIdMiddleware)
+
+@app.exception_handler(HashingPoolBusy)
+async def hashing_pool_busy_handler(request: Request, exc: HashingPoolBusy):
+    # Очередь на проверку паролей переполнена — просим клиента повторить позже
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Сервер перегружен, повторите попытку позже"},
+        headers={"Retry-After": "1"},
+    )
 
 app.include_router(tasks.router, prefix="/api/v3")  # подключение роутера к приложению
 app.include_router(stats.router, prefix="/api/v3")
 app.include_router(auth.router, prefix="/api/v3")
+app.include_router(events.router, prefix="/api/v3")
 
 @app.get("/")
 async def read_root() -> dict:
@@ -71,5 +146,14 @@ async def health_check(
     
     return {
         "status": "healthy",
-        "database": db_status
-    }
\ No newline at end of file
+        "database": db_status,
+        "user_cache": user_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "events": event_hub.stats(),
+        **get_pool_metrics()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """Метрики процесса в текстовом формате Prometheus"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
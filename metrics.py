@@ -0,0 +1,368 @@
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Запросы к БД дольше порога выводятся в журнал вместе с текстом SQL
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+# Режим разработки: заголовки X-DB-Queries/Server-Timing и предупреждения о N+1
+DB_QUERY_DEBUG = os.getenv("DB_QUERY_DEBUG", "false").lower() == "true"
+# Сколько раз один и тот же запрос может выполниться за HTTP-запрос, прежде чем
+# это будет считаться признаком N+1
+DB_REPEATED_QUERY_THRESHOLD = int(os.getenv("DB_REPEATED_QUERY_THRESHOLD", "5"))
+
+# Границы корзин по умолчанию — как в клиентах Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, LabelValues, Sequence[str], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, values, labelnames, value in self.samples():
+            lines.append(f"{name}{_format_labels(labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [(self.name, key, self.labelnames, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        # Значение, вычисляемое при каждом чтении /metrics (например, размер пула)
+        self._function = function
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def samples(self):
+        values = self._function() if self._function is not None else self._values
+        return [(self.name, key, self.labelnames, value) for key, value in sorted(values.items()) if value is not None]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: счетчики корзин (без накопления), сумма и количество
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def totals(self) -> Dict[LabelValues, Tuple[int, float]]:
+        """Количество наблюдений и их сумма для каждого набора меток"""
+        return {key: (count, total) for key, (_, total, count) in self._values.items()}
+
+    def samples(self):
+        samples = []
+        labelnames = self.labelnames + ("le",)
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", key + (_format_value(bound),), labelnames, cumulative))
+            samples.append((f"{self.name}_sum", key, self.labelnames, total))
+            samples.append((f"{self.name}_count", key, self.labelnames, count))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), function=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Метрики хранятся в памяти процесса: при нескольких воркерах Prometheus
+# опрашивает каждый воркер отдельно
+registry = MetricsRegistry()
+
+http_requests_total = registry.counter(
+    "http_requests_total", "Количество HTTP-запросов", ("method", "route", "status"))
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route"))
+http_requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "Запросы, обрабатываемые в данный момент")
+
+db_queries_total = registry.counter(
+    "db_queries_total", "Количество запросов к БД", ("operation",))
+db_query_duration_seconds = registry.histogram(
+    "db_query_duration_seconds", "Время выполнения запроса к БД", ("operation",))
+db_slow_queries_total = registry.counter(
+    "db_slow_queries_total", "Запросы к БД дольше DB_SLOW_QUERY_MS", ("operation",))
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request", "Количество запросов к БД за один HTTP-запрос", ("route",), QUERY_COUNT_BUCKETS)
+db_time_per_request_seconds = registry.histogram(
+    "db_time_per_request_seconds", "Суммарное время запросов к БД за один HTTP-запрос", ("route",))
+db_pool_checkout_wait_seconds = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Ожидание свободного соединения в пуле",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+
+
+class RequestDbStats:
+    __slots__ = ("queries", "seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        # Текст SQL -> сколько раз выполнен. Параметры передаются отдельно,
+        # поэтому одинаковый текст означает одну и ту же форму запроса
+        self.statements: Dict[str, int] = {}
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.queries += 1
+        self.seconds += elapsed
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+
+    def merge(self, other: "RequestDbStats") -> None:
+        self.queries += other.queries
+        self.seconds += other.seconds
+        for statement, count in other.statements.items():
+            self.statements[statement] = self.statements.get(statement, 0) + count
+
+    def repeated(self, threshold: int = DB_REPEATED_QUERY_THRESHOLD) -> List[Tuple[str, int]]:
+        """Запросы, выполненные не меньше threshold раз (вероятный N+1)"""
+        return sorted(
+            ((statement, count) for statement, count in self.statements.items() if count >= threshold),
+            key=lambda item: -item[1]
+        )
+
+
+# Статистика БД текущего HTTP-запроса. Объект изменяемый, поэтому запросы,
+# выполненные в копиях контекста (потоки, фоновые части ответа), тоже учитываются
+_request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("request_db_stats", default=None)
+
+
+def _operation(statement: str) -> str:
+    # Первое слово SQL: SELECT, INSERT, UPDATE, DELETE, ...
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Подсчет и замер времени всех запросов движка"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        operation = _operation(statement)
+        db_queries_total.inc(operation=operation)
+        db_query_duration_seconds.observe(elapsed, operation=operation)
+        stats = _request_db_stats.get()
+        if stats is not None:
+            stats.record(statement, elapsed)
+        if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            db_slow_queries_total.inc(operation=operation)
+            # Параметры не выводятся: в них могут быть персональные данные
+            logger.warning(
+                "Медленный запрос к БД: %.0f мс", elapsed * 1000,
+                extra={"duration_ms": round(elapsed * 1000, 2), "sql": " ".join(statement.split())}
+            )
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        # after_cursor_execute не вызывается для запросов с ошибкой
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+
+def _debug_headers(stats: RequestDbStats) -> List[Tuple[bytes, bytes]]:
+    repeated = stats.repeated()
+    headers = [
+        (b"x-db-queries", str(stats.queries).encode()),
+        (b"server-timing", f'db;dur={stats.seconds * 1000:.2f};desc="{stats.queries} queries"'.encode()),
+    ]
+    if repeated:
+        headers.append((b"x-db-repeated-queries", str(len(repeated)).encode()))
+    return headers
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def count_queries() -> Iterator[RequestDbStats]:
+    """Счетчик запросов к БД внутри блока, включая HTTP-запросы к приложению в том же контексте.
+
+        with count_queries() as stats:
+            await client.get("/api/v3/tasks", headers=headers)
+        assert_query_budget(stats, 2)
+    """
+    stats = RequestDbStats()
+    token = _request_db_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_db_stats.reset(token)
+
+
+def assert_query_budget(stats: RequestDbStats, max_queries: int, max_repeats: Optional[int] = None) -> None:
+    problems = []
+    if stats.queries > max_queries:
+        problems.append(f"выполнено запросов к БД: {stats.queries}, допустимо: {max_queries}")
+    if max_repeats is not None:
+        for statement, count in stats.repeated(max_repeats + 1):
+            problems.append(f"запрос выполнен {count} раз (допустимо {max_repeats}): {' '.join(statement.split())}")
+    if problems:
+        statements = "\n".join(f"  {count} x {' '.join(statement.split())}" for statement, count in stats.statements.items())
+        raise QueryBudgetExceeded("; ".join(problems) + "\n" + statements)
+
+
+def _route_label(scope) -> str:
+    # Шаблон пути (/api/v3/tasks/{task_id}), а не сам путь: число меток ограничено
+    route = scope.get("route")
+    return getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: задержка, статусы и запросы к БД по маршрутам"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        stats = RequestDbStats()
+        # Внешний счетчик (count_queries в проверках бюджета) получает запросы этого HTTP-запроса
+        parent = _request_db_stats.get()
+        token = _request_db_stats.set(stats)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if DB_QUERY_DEBUG:
+                    # Учитываются запросы, выполненные до начала ответа
+                    message["headers"] = list(message.get("headers", [])) + _debug_headers(stats)
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            _request_db_stats.reset(token)
+            route = _route_label(scope)
+            method = scope["method"]
+            http_requests_total.inc(method=method, route=route, status=str(status_code))
+            http_request_duration_seconds.observe(elapsed, method=method, route=route)
+            db_queries_per_request.observe(stats.queries, route=route)
+            db_time_per_request_seconds.observe(stats.seconds, route=route)
+            if DB_QUERY_DEBUG:
+                for statement, count in stats.repeated():
+                    logger.warning(
+                        "Повторяющийся запрос к БД (возможен N+1): %d раз в %s %s", count, method, route,
+                        extra={"count": count, "sql": " ".join(statement.split())}
+                    )
+            if parent is not None:
+                parent.merge(stats)
@@ -1,5 +1,7 @@
 from database import Base
 from models.task import Task
 from models.user import User, UserRole
+from models.tombstone import TaskTombstone
+from models.session import AuthSession
 
-__all__ = ['Task', 'User', 'UserRole', 'Base']
\ No newline at end of file
+__all__ = ['AuthSession', 'Task', 'TaskTombstone', 'User', 'UserRole', 'Base']
\ No newline at end of file
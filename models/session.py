@@ -0,0 +1,66 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from database import Base
+from sql_functions import utcnow
+
+
+class AuthSession(Base):
+    """Refresh-токен сессии входа. Токены одной цепочки обновлений имеют общий family_id"""
+    __tablename__ = "auth_sessions"
+
+    id = Column(
+        Integer,
+        primary_key=True,
+        autoincrement=True
+    )
+
+    user_id = Column(
+        Integer,
+        ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True
+    )
+
+    # Идентификатор сессии, он же claim sid в токенах доступа
+    family_id = Column(
+        String(32),
+        nullable=False,
+        index=True
+    )
+
+    # Хранится только SHA-256 токена: утечка таблицы не дает действующих токенов
+    token_hash = Column(
+        String(64),
+        nullable=False,
+        unique=True
+    )
+
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=utcnow(),
+        nullable=False
+    )
+
+    expires_at = Column(
+        DateTime(timezone=True),
+        nullable=False
+    )
+
+    # Токен обменян на новый; повторное предъявление — признак кражи
+    rotated_at = Column(
+        DateTime(timezone=True),
+        nullable=True
+    )
+
+    revoked_at = Column(
+        DateTime(timezone=True),
+        nullable=True
+    )
+
+    __table_args__ = (
+        # Индексы для синхронизации отозванных сессий и удаления истекших
+        Index('ix_auth_sessions_revoked_at', 'revoked_at'),
+        Index('ix_auth_sessions_expires_at', 'expires_at'),
+    )
+
+    def __repr__(self) -> str:
+        return f"<AuthSession(user_id={self.user_id}, family_id='{self.family_id}')>"
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database import Base
+from sql_functions import utcnow, current_change_seq
+from clock import current_clock
 
 from pydantic import BaseModel, Field
 from typing import Optional
@@ -49,7 +50,22 @@ class Task(Base):
 
     created_at = Column(
         DateTime(timezone=True), # С поддержкой часовых поясов
-        server_default=func.now(), # Автоматически текущее время
+        server_default=utcnow(), # Автоматически текущее время
+        nullable=False
+    )
+
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=utcnow(),
+        onupdate=utcnow(), # Обновляется при каждом изменении строки (в том числе UPDATE-запросами)
+        nullable=False
+    )
+
+    change_seq = Column(
+        BigInteger,
+        default=current_change_seq(), # Номер изменения для синхронизации (GET /tasks/changes)
+        onupdate=current_change_seq(),
+        server_default="0", # Для строк, созданных до появления синхронизации
         nullable=False
     )
 
@@ -67,6 +83,26 @@ class Task(Base):
 
     owner = relationship('User', back_populates='tasks')
 
+    # Серверные значения по умолчанию (created_at, updated_at) возвращаются прямо из INSERT,
+    # без отдельного SELECT после commit
+    __mapper_args__ = {"eager_defaults": True}
+
+    __table_args__ = (
+        # Индексы для keyset-пагинации по (created_at, id)
+        Index('ix_tasks_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_tasks_created_at_id', 'created_at', 'id'),
+        # Индекс для выборки незавершенных задач пользователя по дедлайну
+        Index('ix_tasks_user_id_completed_deadline_at', 'user_id', 'completed', 'deadline_at'),
+        # Индексы для выборки по квадранту и фонового пересчета квадрантов
+        Index('ix_tasks_user_id_quadrant', 'user_id', 'quadrant'),
+        Index('ix_tasks_deadline_at', 'deadline_at'),
+        # Индекс для max(updated_at) при вычислении ETag
+        Index('ix_tasks_user_id_updated_at', 'user_id', 'updated_at'),
+        # Индексы для выборки изменений после токена синхронизации
+        Index('ix_tasks_user_id_change_seq_id', 'user_id', 'change_seq', 'id'),
+        Index('ix_tasks_change_seq_id', 'change_seq', 'id'),
+    )
+
     def __repr__(self) -> str:
         return f"<Task(id={self.id}, title='{self.title}', quadrant='{self.quadrant}')>"
 
@@ -80,6 +116,7 @@ class Task(Base):
             "quadrant": self.quadrant,
             "completed": self.completed,
             "created_at": self.created_at,
+            "updated_at": self.updated_at,
             "completed_at": self.completed_at,
             "user_id": self.user_id
         }
@@ -87,22 +124,12 @@ class Task(Base):
     @property
     def is_urgent(self) -> bool:
         """Calculate urgency based on deadline"""
-        if not self.deadline_at:
-            return False
-        
-        today = datetime.now().date()
-        deadline_date = self.deadline_at.date()
-        days_until_deadline = (deadline_date - today).days
-        
-        return days_until_deadline <= 3
-    
+        # Импорт здесь: task_queries сам импортирует эту модель
+        from task_queries import deadline_is_urgent
+        return deadline_is_urgent(self.days_until_deadline)
+
     @property
-    def days_until_deadline(self) -> int:
+    def days_until_deadline(self) -> Optional[int]:
         """Calculate days until deadline"""
-        if not self.deadline_at:
-            return None
-        
-        today = datetime.now().date()
-        deadline_date = self.deadline_at.date()
-        return (deadline_date - today).days
-    
\ No newline at end of file
+        # Часы текущего запроса: одна дата и часовой пояс клиента для всех задач ответа
+        return current_clock().days_until(self.deadline_at)
@@ -0,0 +1,47 @@
+from sqlalchemy import Column, Integer, BigInteger, DateTime, Index
+from database import Base
+from sql_functions import utcnow, current_change_seq
+
+
+class TaskTombstone(Base):
+    """Запись об удаленной задаче для инкрементальной синхронизации клиентов"""
+    __tablename__ = "task_tombstones"
+
+    id = Column(
+        Integer,
+        primary_key=True,
+        autoincrement=True
+    )
+
+    task_id = Column(
+        Integer,
+        nullable=False
+    )
+
+    # Без внешнего ключа: пользователь может быть удален вместе с задачами
+    user_id = Column(
+        Integer,
+        nullable=False
+    )
+
+    change_seq = Column(
+        BigInteger,
+        default=current_change_seq(),
+        nullable=False
+    )
+
+    deleted_at = Column(
+        DateTime(timezone=True),
+        server_default=utcnow(),
+        nullable=False
+    )
+
+    __table_args__ = (
+        Index('ix_task_tombstones_user_id_change_seq_task_id', 'user_id', 'change_seq', 'task_id'),
+        Index('ix_task_tombstones_change_seq_task_id', 'change_seq', 'task_id'),
+        # Индекс для удаления старых записей
+        Index('ix_task_tombstones_deleted_at', 'deleted_at'),
+    )
+
+    def __repr__(self) -> str:
+        return f"<TaskTombstone(task_id={self.task_id}, change_seq={self.change_seq})>"
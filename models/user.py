@@ -42,6 +42,14 @@ class User(Base):
         default=UserRole.USER  # По умолчанию - обычный пользователь
     )
     
+    # Версия токенов: увеличивается при смене пароля, токены с прежней версией отклоняются
+    token_version = Column(
+        Integer,
+        nullable=False,
+        default=0,
+        server_default="0"
+    )
+    
     # Связь с задачами (один пользователь -> много задач)
     tasks = relationship(
         "Task",
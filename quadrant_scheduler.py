@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import update, or_, and_
+from dotenv import load_dotenv
+
+from database import AsyncSessionLocal
+from models.task import Task
+from task_queries import urgency_boundary, quadrant_expr
+from task_events import commit_tasks_changed
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL_SECONDS = int(os.getenv("QUADRANT_REFRESH_SECONDS", "300"))
+
+# Граница срочности, до которой квадранты уже пересчитаны (водяной знак).
+# None — пересчет еще не выполнялся в этом процессе.
+_last_boundary: Optional[datetime] = None
+
+
+async def refresh_quadrants(now: Optional[datetime] = None) -> int:
+    """Пересчитывает квадранты задач, пересекших границу срочности с прошлого запуска"""
+    global _last_boundary
+    boundary = urgency_boundary(now or datetime.now().astimezone())
+    if _last_boundary is not None and boundary <= _last_boundary:
+        return 0
+
+    async with AsyncSessionLocal() as session:
+        if _last_boundary is None:
+            # Первый запуск: сверяем все задачи, у которых квадрант не соответствует сроку
+            became_urgent = update(Task).where(
+                Task.deadline_at < boundary,
+                Task.quadrant.in_(["Q2", "Q4"])
+            ).values(quadrant=quadrant_expr(Task.is_important, True))
+            became_not_urgent = update(Task).where(
+                or_(Task.deadline_at.is_(None), Task.deadline_at >= boundary),
+                Task.quadrant.in_(["Q1", "Q3"])
+            ).values(quadrant=quadrant_expr(Task.is_important, False))
+            statements = [became_urgent, became_not_urgent]
+        else:
+            # Граница только сдвигается вперед, поэтому срочными становятся лишь
+            # задачи с дедлайном между старой и новой границей
+            statements = [
+                update(Task).where(
+                    and_(Task.deadline_at >= _last_boundary, Task.deadline_at < boundary),
+                    Task.quadrant.in_(["Q2", "Q4"])
+                ).values(quadrant=quadrant_expr(Task.is_important, True))
+            ]
+
+        rows = []
+        for statement in statements:
+            result = await session.execute(
+                statement.returning(Task.id, Task.user_id).execution_options(synchronize_session=False)
+            )
+            rows.extend(result.all())
+        # События всех владельцев отправляются одним запросом в этой же транзакции
+        await commit_tasks_changed(session, "task.updated", rows)
+
+    _last_boundary = boundary
+    return len(rows)
+
+
+async def run_quadrant_scheduler(interval: int = REFRESH_INTERVAL_SECONDS):
+    # Фоновая задача, запускаемая из lifespan приложения
+    while True:
+        try:
+            updated = await refresh_quadrants()
+            if updated:
+                logger.info("Пересчитаны квадранты задач: %d", updated)
+        except Exception:
+            logger.exception("Ошибка пересчета квадрантов")
+        await asyncio.sleep(interval)
@@ -0,0 +1,241 @@
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+from auth_utils import decode_access_token
+from cache_backends import CACHE_BACKEND, REDIS_URL
+from metrics import registry
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# memory — лимиты в каждом воркере отдельно, redis — общие для всех воркеров
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", CACHE_BACKEND)
+# Сколько ключей (пользователей и IP) хранится в памяти; вытесненный ключ
+# начинает с полного запаса
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Лимиты групп маршрутов в формате "количество/период" (second, minute, hour)
+RATE_LIMIT_AUTH = os.getenv("RATE_LIMIT_AUTH", "10/minute")
+RATE_LIMIT_SEARCH = os.getenv("RATE_LIMIT_SEARCH", "30/minute")
+RATE_LIMIT_API = os.getenv("RATE_LIMIT_API", "600/minute")
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600}
+
+rate_limited_requests_total = registry.counter(
+    "rate_limited_requests_total", "Запросы, отклоненные ограничением частоты", ("policy",))
+
+
+def parse_rate(value: str) -> Tuple[int, int]:
+    """Лимит вида "10/minute" -> (10, 60)"""
+    try:
+        limit, period = value.split("/")
+        return int(limit), _PERIODS[period.strip()]
+    except (ValueError, KeyError):
+        raise RuntimeError(f"Неверный формат лимита: {value!r}, ожидается, например, 10/minute")
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """Лимит группы маршрутов: limit запросов за period секунд с запасом limit подряд"""
+    name: str
+    limit: int
+    period: int
+    # user — по пользователю из токена (без токена — по IP), ip — по адресу клиента
+    key: str = "user"
+    # Префиксы путей группы
+    paths: Sequence[str] = ()
+    # None — любые методы
+    methods: Optional[Sequence[str]] = None
+
+    @property
+    def rate(self) -> float:
+        return self.limit / self.period
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods is not None and method not in self.methods:
+            return False
+        return any(path.startswith(prefix) for prefix in self.paths)
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    remaining: int
+    # Через сколько секунд будет доступен следующий запрос и восстановится весь запас
+    retry_after: int
+    reset: int
+
+
+def _result(allowed: bool, tokens: float, policy: RateLimitPolicy) -> RateLimitResult:
+    return RateLimitResult(
+        allowed=allowed,
+        remaining=int(tokens),
+        retry_after=0 if allowed else math.ceil((1 - tokens) / policy.rate),
+        reset=math.ceil((policy.limit - tokens) / policy.rate),
+    )
+
+
+class InMemoryRateLimitBackend:
+    """Корзины токенов в памяти процесса: на ключ хранятся запас и время обновления"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, policy: RateLimitPolicy) -> RateLimitResult:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (policy.limit, now))
+        # Запас пополняется пропорционально прошедшему времени
+        tokens = min(policy.limit, tokens + (now - updated_at) * policy.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return _result(allowed, tokens, policy)
+
+
+# Пополнение и списание выполняются в Redis атомарно, поэтому воркеры не
+# обгоняют друг друга. Время передает воркер: часы серверов приложения
+# должны быть синхронизированы.
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or limit
+local ts = tonumber(state[2]) or now
+tokens = math.min(limit, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(limit / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisRateLimitBackend:
+    """Корзины токенов, общие для нескольких воркеров"""
+
+    def __init__(self, url: str = REDIS_URL):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("Для RATE_LIMIT_BACKEND=redis установите пакет redis")
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key: str, policy: RateLimitPolicy) -> RateLimitResult:
+        allowed, tokens = await self._script(keys=[key], args=[policy.rate, policy.limit, time.time()])
+        return _result(bool(allowed), float(tokens), policy)
+
+
+def create_rate_limit_backend():
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisRateLimitBackend()
+    if RATE_LIMIT_BACKEND == "memory":
+        return InMemoryRateLimitBackend()
+    raise RuntimeError(f"Неизвестный RATE_LIMIT_BACKEND: {RATE_LIMIT_BACKEND}")
+
+
+def _client_ip(scope) -> str:
+    # За прокси адрес клиента подставляет uvicorn (--proxy-headers, --forwarded-allow-ips)
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _token_user_id(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            # Декодированные токены кэшируются, проверка подписи не повторяется
+            payload = decode_access_token(token)
+            return payload.get("sub") if payload else None
+    return None
+
+
+def _headers(policy: RateLimitPolicy, result: RateLimitResult) -> list:
+    headers = [
+        (b"ratelimit-limit", str(policy.limit).encode()),
+        (b"ratelimit-remaining", str(result.remaining).encode()),
+        (b"ratelimit-reset", str(result.reset).encode()),
+        (b"ratelimit-policy", f"{policy.limit};w={policy.period}".encode()),
+    ]
+    if not result.allowed:
+        headers.append((b"retry-after", str(result.retry_after).encode()))
+    return headers
+
+
+class RateLimitMiddleware:
+    """ASGI-middleware: ограничение частоты запросов по группам маршрутов.
+
+    Применяется первая подходящая политика. При недоступности хранилища
+    запросы пропускаются: ограничение не должно останавливать API.
+    """
+
+    def __init__(self, app, policies: Sequence[RateLimitPolicy], backend=None):
+        self.app = app
+        self.policies = list(policies)
+        self.backend = backend if backend is not None else create_rate_limit_backend()
+
+    def _policy(self, method: str, path: str) -> Optional[RateLimitPolicy]:
+        for policy in self.policies:
+            if policy.matches(method, path):
+                return policy
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        policy = self._policy(scope["method"], scope["path"])
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        user_id = _token_user_id(scope) if policy.key == "user" else None
+        key = f"ratelimit:{policy.name}:" + (f"user:{user_id}" if user_id is not None else f"ip:{_client_ip(scope)}")
+        try:
+            result = await self.backend.take(key, policy)
+        except Exception:
+            logger.exception("Ошибка хранилища ограничения частоты запросов")
+            await self.app(scope, receive, send)
+            return
+
+        headers = _headers(policy, result)
+        if not result.allowed:
+            rate_limited_requests_total.inc(policy=policy.name)
+            body = json.dumps({"detail": "Слишком много запросов, повторите попытку позже"}, ensure_ascii=False).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ] + headers,
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+from typing import Any, Awaitable, Callable, Iterable, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from cache_backends import create_cache_backend
+from models.user import User
+
+load_dotenv()
+
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+
+# Тело ответа (уже готовое к JSON) и дополнительные заголовки
+CachedBody = Tuple[Any, dict]
+
+
+class ResponseCache:
+    """Кэш ответов списков задач и статистики.
+
+    Ключ содержит номер версии данных: у каждого пользователя своя версия,
+    у администраторов — общая версия по всем задачам. Любое изменение задач
+    увеличивает версию владельца и общую версию, поэтому инвалидация — O(1),
+    а устаревшие записи просто перестают запрашиваться и вытесняются по TTL.
+    """
+
+    ALL_USERS_VERSION_KEY = "resp:version:all"
+
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _user_version_key(user_id: int) -> str:
+        return f"resp:version:user:{user_id}"
+
+    async def _scope(self, current_user: User) -> str:
+        if current_user.role.value == "admin":
+            version = await self.backend.get_counter(self.ALL_USERS_VERSION_KEY)
+            return f"admin:{version}"
+        version = await self.backend.get_counter(self._user_version_key(current_user.id))
+        return f"user:{current_user.id}:{version}"
+
+    @staticmethod
+    def _params_digest(params: dict) -> str:
+        raw = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    async def key_for(self, current_user: User, endpoint: str, params: dict) -> str:
+        # Версию читаем до запроса к БД: если данные изменятся во время запроса,
+        # результат сохранится под старой версией и не будет выдан
+        return f"resp:{await self._scope(current_user)}:{endpoint}:{self._params_digest(params)}"
+
+    async def lookup(self, key: str) -> Optional[CachedBody]:
+        cached = await self.backend.get(key)
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return cached["body"], cached["headers"]
+
+    async def store(self, key: str, body: Any, headers: dict) -> None:
+        await self.backend.set(key, {"body": body, "headers": headers}, self.ttl)
+
+    async def get_or_set(
+        self,
+        current_user: User,
+        endpoint: str,
+        params: dict,
+        produce: Callable[[], Awaitable[CachedBody]],
+    ) -> CachedBody:
+        key = await self.key_for(current_user, endpoint, params)
+        cached = await self.lookup(key)
+        if cached is not None:
+            return cached
+        body, headers = await produce()
+        await self.store(key, body, headers)
+        return body, headers
+
+    async def invalidate_users(self, user_ids: Iterable[Optional[int]]) -> None:
+        for user_id in set(user_ids):
+            if user_id is not None:
+                await self.backend.incr(self._user_version_key(user_id))
+        await self.invalidate_admin()
+
+    # Ответы администраторов зависят и от состава пользователей (статистика by_user),
+    # поэтому общая версия увеличивается и при регистрации пользователя
+    async def invalidate_admin(self) -> None:
+        await self.backend.incr(self.ALL_USERS_VERSION_KEY)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+response_cache = ResponseCache(create_cache_backend(RESPONSE_CACHE_MAX_ENTRIES), RESPONSE_CACHE_TTL_SECONDS)
+
@@ -1,12 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, or_
 from database import get_async_session
 from models import User, UserRole, Task
-from schemas_auth import UserCreate, UserResponse, Token, PasswordChange, UserWithTaskCount
-from auth_utils import verify_password, get_password_hash, create_access_token
+from schemas_auth import UserCreate, UserResponse, Token, RefreshRequest, PasswordChange, UserWithTaskCount
+from auth_utils import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    verify_password_async,
+    verify_and_update_password_async,
+    get_password_hash_async,
+    create_access_token,
+)
+from auth_sessions import (
+    InvalidRefreshToken,
+    create_session,
+    find_family,
+    revoke_family,
+    revoke_user_sessions,
+    revoked_sessions,
+    rotate_session,
+)
 from dependencies import get_current_user, get_current_admin
+from token_versions import token_versions
+from user_cache import user_cache
+from response_cache import response_cache
 
 router = APIRouter(
     prefix="/auth",
@@ -14,27 +32,38 @@ router = APIRouter(
 )
 
 
+def issue_tokens(user: User, refresh_token: str, family_id: str) -> dict:
+    # sid связывает токен доступа с сессией, чтобы его можно было отозвать
+    access_token = create_access_token(
+        data={"sub": str(user.id), "role": user.role.value, "tv": user.token_version, "sid": family_id}
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 # Регистрация нового пользователя
 async def register(
     user_data: UserCreate,
     db: AsyncSession = Depends(get_async_session)
 ):
-    # Проверяем, не занят ли email
+    # Email и nickname проверяются одним запросом
     result = await db.execute(
-        select(User).where(User.email == user_data.email)
+        select(User.email, User.nickname).where(
+            or_(User.email == user_data.email, User.nickname == user_data.nickname)
+        )
     )
-    if result.scalar_one_or_none():
+    existing = result.all()
+    if any(row.email == user_data.email for row in existing):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Пользователь с таким email уже существует"
         )
-    
-    # Проверяем, не занят ли nickname
-    result = await db.execute(
-        select(User).where(User.nickname == user_data.nickname)
-    )
-    if result.scalar_one_or_none():
+    if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Пользователь с таким никнеймом уже существует"
@@ -44,13 +73,14 @@ async def register(
     new_user = User(
         nickname=user_data.nickname,
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=await get_password_hash_async(user_data.password),
         role=UserRole.USER  # По умолчанию обычный пользователь
     )
     
     db.add(new_user)
+    # Все поля известны до вставки, id возвращается INSERT'ом: refresh не нужен
     await db.commit()
-    await db.refresh(new_user)
+    await response_cache.invalidate_admin()
     
     return new_user
 
@@ -67,19 +97,59 @@ async def login(
     user = result.scalar_one_or_none()
     
     # Проверяем пользователя и пароль
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if user:
+        verified, new_hash = await verify_and_update_password_async(form_data.password, user.hashed_password)
+    else:
+        verified, new_hash = False, None
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    # Параметры Argon2 изменились — сохраняем пересчитанный хеш
+    if new_hash:
+        user.hashed_password = new_hash
     
-    # Создаем JWT токен
-    access_token = create_access_token(
-        data={"sub": str(user.id), "role": user.role.value}
-    )
+    # Новая сессия: токен доступа и refresh-токен для его продления
+    refresh_token, family_id = create_session(db, user.id)
+    await db.commit()
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    return issue_tokens(user, refresh_token, family_id)
+
+
+@router.post("/refresh", response_model=Token)
+# Обмен refresh-токена на новую пару токенов без проверки пароля
+async def refresh(
+    data: RefreshRequest,
+    db: AsyncSession = Depends(get_async_session)
+):
+    try:
+        user, refresh_token, family_id = await rotate_session(db, data.refresh_token)
+    except InvalidRefreshToken:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Недействительный refresh-токен",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    return issue_tokens(user, refresh_token, family_id)
+
+
+@router.post("/logout", status_code=status.HTTP_200_OK)
+# Завершение сессии: refresh-токен и выданные по нему токены доступа отзываются
+async def logout(
+    data: RefreshRequest,
+    db: AsyncSession = Depends(get_async_session)
+):
+    family_id = await find_family(db, data.refresh_token)
+    if family_id is not None:
+        families = await revoke_family(db, family_id)
+        await db.commit()
+        revoked_sessions.add(families)
+    
+    return {"message": "Выход выполнен"}
 
 
 @router.get("/me", response_model=UserResponse)
@@ -97,8 +167,14 @@ async def change_password(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_async_session)
 ):
+    # current_user может быть взят из кэша, поэтому хеш пароля читаем из БД
+    result = await db.execute(
+        select(User).where(User.id == current_user.id)
+    )
+    user = result.scalar_one()
+
     # Проверяем старый пароль
-    if not verify_password(password_data.old_password, current_user.hashed_password):
+    if not await verify_password_async(password_data.old_password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Неверный текущий пароль"
@@ -111,11 +187,18 @@ async def change_password(
             detail="Новый пароль должен отличаться от текущего"
         )
     
-    # Обновляем пароль
-    current_user.hashed_password = get_password_hash(password_data.new_password)
+    # Обновляем пароль; новая версия токенов и отзыв сессий завершают все входы
+    user.hashed_password = await get_password_hash_async(password_data.new_password)
+    user.token_version += 1
+    families = await revoke_user_sessions(db, user.id)
+    # Текущему клиенту выдается новая сессия, чтобы не требовать повторного входа
+    refresh_token, family_id = create_session(db, user.id)
     await db.commit()
+    await user_cache.invalidate(user.id)
+    token_versions.set(user.id, user.token_version)
+    revoked_sessions.add(families)
     
-    return {"message": "Пароль успешно изменен"}
+    return {"message": "Пароль успешно изменен", **issue_tokens(user, refresh_token, family_id)}
 
 
 @router.get("/admin/users", response_model=list[UserWithTaskCount])
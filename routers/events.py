@@ -0,0 +1,107 @@
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import asyncio
+import contextlib
+import json
+
+from database import AsyncSessionLocal
+from dependencies import authenticate_token
+from models.user import User
+from task_events import event_hub, EVENTS_HEARTBEAT_SECONDS
+
+router = APIRouter(
+    prefix="/events",
+    tags=["events"]
+)
+
+# Через сколько миллисекунд браузер переподключается после обрыва
+SSE_RETRY_MS = 3000
+
+
+async def _authenticate(token: Optional[str]) -> Optional[User]:
+    # Подключение живет долго, поэтому сессия БД открывается только на время проверки токена
+    if not token:
+        return None
+    async with AsyncSessionLocal() as db:
+        return await authenticate_token(token, db)
+
+
+def _bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    return None
+
+
+def _format_sse(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+@router.get("")
+async def stream_events(
+    request: Request,
+    token: Optional[str] = Query(None, description="Токен доступа (EventSource не умеет передавать заголовки)"),
+    last_event_id: Optional[str] = Query(None, description="Продолжить после события (вместо заголовка Last-Event-ID)"),
+) -> StreamingResponse:
+    """Server-Sent Events: изменения задач пользователя (для администратора — всех задач)"""
+    current_user = await _authenticate(token or _bearer_token(request.headers.get("authorization")))
+    if current_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Не удалось проверить учетные данные",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    subscription = event_hub.subscribe(current_user, request.headers.get("last-event-id") or last_event_id)
+
+    async def body():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            async for event in subscription.events(EVENTS_HEARTBEAT_SECONDS):
+                # Комментарий-heartbeat не дает прокси закрыть простаивающее соединение
+                yield ": ping\n\n" if event is None else _format_sse(event)
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws")
+async def websocket_events(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None),
+    last_event_id: Optional[str] = Query(None),
+):
+    """Те же события через WebSocket: JSON-сообщения, heartbeat — {"type": "ping"}"""
+    current_user = await _authenticate(token)
+    if current_user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    subscription = event_hub.subscribe(current_user, last_event_id)
+
+    async def send_events():
+        async for event in subscription.events(EVENTS_HEARTBEAT_SECONDS):
+            await websocket.send_json({"type": "ping"} if event is None else event)
+        # Буфер переполнен: клиент переподключится с last_event_id
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+
+    async def receive_until_closed():
+        # Сообщения клиента не используются, но чтение нужно, чтобы заметить отключение
+        with contextlib.suppress(WebSocketDisconnect):
+            while True:
+                await websocket.receive_text()
+
+    sender = asyncio.create_task(send_events())
+    receiver = asyncio.create_task(receive_until_closed())
+    try:
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (sender, receiver):
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, WebSocketDisconnect, RuntimeError):
+                await task
+        event_hub.unsubscribe(subscription)
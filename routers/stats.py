@@ -1,84 +1,232 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func, case
 from models.task import Task
 from models.user import User
 from database import get_async_session
 from schemas import TaskDeadlineStats
-from dependencies import get_current_user
-from typing import List
+from dependencies import get_token_user
+from typing import List, Optional
+from datetime import datetime, time, timedelta, timezone
+from etags import conditional_json_response
+from task_queries import QUADRANTS, apply_task_scope, fetch_task_fingerprint
+from clock import Clock, current_clock, get_request_clock
+from sql_functions import seconds_between, days_between, date_in_zone, zone_name
 
 router = APIRouter(
     prefix="/stats",
-    tags=["stats"]
+    tags=["stats"],
+    dependencies=[Depends(get_request_clock)]
 )
 
-@router.get("/", response_model=dict)
-async def get_tasks_stats(
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_async_session)
-) -> dict:
-    # Администраторы видят статистику по всем задачам
-    if current_user.role.value == "admin":
-        result = await db.execute(select(Task))
-    else:
-        # Обычные пользователи видят только свои задачи
-        result = await db.execute(
-            select(Task).where(Task.user_id == current_user.id)
-        )
-    tasks = result.scalars().all()
-    total_tasks = len(tasks)
-    by_quadrant = {q: 0 for q in ["Q1", "Q2", "Q3", "Q4"]}
+LATENCY_PERCENTILES = [0.5, 0.9, 0.99]
+
+
+async def _count_by_quadrant_and_status(db: AsyncSession, current_user: User) -> dict:
+    # Один агрегирующий запрос вместо загрузки всех задач
+    query = apply_task_scope(
+        select(Task.quadrant, Task.completed, func.count().label("count"))
+        .group_by(Task.quadrant, Task.completed),
+        current_user,
+    )
+    result = await db.execute(query)
+
+    by_quadrant = {q: 0 for q in QUADRANTS}
     by_status = {"completed": 0, "pending": 0}
-    for task in tasks:
-        if task.quadrant in by_quadrant:
-            by_quadrant[task.quadrant] += 1
-        if task.completed:
-            by_status["completed"] += 1
-        else:
-            by_status["pending"] += 1
+    total_tasks = 0
+    for quadrant, completed, count in result.all():
+        total_tasks += count
+        if quadrant in by_quadrant:
+            by_quadrant[quadrant] += count
+        by_status["completed" if completed else "pending"] += count
     return {
         "total_tasks": total_tasks,
         "by_quadrant": by_quadrant,
         "by_status": by_status
     }
 
+
+async def _count_by_user(db: AsyncSession) -> List[dict]:
+    result = await db.execute(
+        select(
+            User.id,
+            User.nickname,
+            func.count(Task.id).label("total"),
+            func.coalesce(func.sum(case((Task.completed == True, 1), else_=0)), 0).label("completed")
+        )
+        .outerjoin(Task, User.id == Task.user_id)
+        .group_by(User.id, User.nickname)
+        .order_by(User.id)
+    )
+    return [
+        {
+            "user_id": row.id,
+            "nickname": row.nickname,
+            "total_tasks": row.total,
+            "completed": row.completed,
+            "pending": row.total - row.completed
+        }
+        for row in result.all()
+    ]
+
+
+async def _daily_histogram(db: AsyncSession, current_user: User, days: int) -> List[dict]:
+    clock = current_clock()
+    # Начало окна и даты корзин — в часовом поясе клиента. Граница передается в UTC:
+    # в SQLite отметки хранятся в UTC без пояса и сравниваются как строки
+    since = datetime.combine(clock.today - timedelta(days=days - 1), time.min, tzinfo=clock.tz)
+    since = since.astimezone(timezone.utc)
+    histogram = {}
+    for column, key in ((Task.created_at, "created"), (Task.completed_at, "completed")):
+        day = date_in_zone(column, clock)
+        query = apply_task_scope(
+            select(day.label("day"), func.count().label("count"))
+            .where(column >= since)
+            .group_by(day),
+            current_user,
+        )
+        result = await db.execute(query)
+        for day_value, count in result.all():
+            entry = histogram.setdefault(str(day_value), {"date": str(day_value), "created": 0, "completed": 0})
+            entry[key] = count
+    return [histogram[day_value] for day_value in sorted(histogram)]
+
+
+async def _completion_latency(db: AsyncSession, current_user: User) -> dict:
+    latency = seconds_between(Task.created_at, Task.completed_at)
+    completed_filter = (Task.completed == True, Task.completed_at.isnot(None))
+
+    summary_query = apply_task_scope(
+        select(func.count().label("count"), func.avg(latency).label("avg")).where(*completed_filter),
+        current_user,
+    )
+    summary = (await db.execute(summary_query)).one()
+    percentiles = {f"p{int(p * 100)}": None for p in LATENCY_PERCENTILES}
+    if summary.count:
+        if db.bind.dialect.name == "postgresql":
+            # Перцентили считает сама БД
+            query = apply_task_scope(
+                select(*[
+                    func.percentile_cont(p).within_group(latency).label(f"p{int(p * 100)}")
+                    for p in LATENCY_PERCENTILES
+                ]).where(*completed_filter),
+                current_user,
+            )
+            row = (await db.execute(query)).one()
+            percentiles = {key: getattr(row, key) for key in percentiles}
+        else:
+            # Без percentile_cont берем значение по рангу через OFFSET
+            for p in LATENCY_PERCENTILES:
+                query = apply_task_scope(
+                    select(latency).where(*completed_filter)
+                    .order_by(latency)
+                    .offset(round(p * (summary.count - 1)))
+                    .limit(1),
+                    current_user,
+                )
+                percentiles[f"p{int(p * 100)}"] = (await db.execute(query)).scalar()
+    return {
+        "completed_tasks": summary.count,
+        "avg_seconds": summary.avg,
+        **{f"{key}_seconds": value for key, value in percentiles.items()}
+    }
+
+
+async def _stats_fingerprint(db: AsyncSession, current_user: User, by_user: bool) -> tuple:
+    fingerprint = await fetch_task_fingerprint(db, current_user)
+    if by_user:
+        # В разбивке по пользователям видны и пользователи без задач
+        users = (await db.execute(select(func.count(), func.max(User.id)))).one()
+        fingerprint = (*fingerprint, *users)
+    return fingerprint
+
+
+@router.get("/", response_model=dict)
+async def get_tasks_stats(
+    request: Request,
+    by_user: bool = Query(False, description="Разбивка по пользователям (только для администратора)"),
+    days: Optional[int] = Query(None, ge=1, le=366, description="Гистограмма созданных/завершенных задач за N дней"),
+    latency: bool = Query(False, description="Перцентили времени выполнения задач"),
+    current_user: User = Depends(get_token_user),
+    db: AsyncSession = Depends(get_async_session)
+) -> dict:
+    if by_user and current_user.role.value != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Недостаточно прав доступа"
+        )
+
+    async def produce():
+        # Администраторы видят статистику по всем задачам,
+        # обычные пользователи — только по своим
+        stats = await _count_by_quadrant_and_status(db, current_user)
+        if by_user:
+            stats["by_user"] = await _count_by_user(db)
+        if days is not None:
+            stats["by_day"] = await _daily_histogram(db, current_user, days)
+        if latency:
+            stats["completion_latency"] = await _completion_latency(db, current_user)
+        return stats, {}
+
+    params = {"by_user": by_user, "days": days, "latency": latency, "today": current_clock().key}
+    return await conditional_json_response(
+        request, current_user, "stats", params,
+        lambda: _stats_fingerprint(db, current_user, by_user),
+        produce
+    )
+
+async def _deadline_stats(
+    db: AsyncSession,
+    current_user: User,
+    clock: Clock,
+    within_days: Optional[int],
+    limit: Optional[int],
+):
+    today_start, _ = clock.today_window()
+    query = apply_task_scope(
+        select(
+            Task.title,
+            Task.description,
+            Task.created_at,
+            days_between(today_start, Task.deadline_at, zone_name(clock)).label("days_until_deadline")
+        ).where(
+            Task.completed == False,
+            Task.deadline_at.isnot(None)
+        ),
+        current_user,
+    )
+    if within_days is not None:
+        query = query.where(Task.deadline_at < today_start + timedelta(days=within_days + 1))
+    # Сортируем по дедлайну (сначала самые срочные)
+    query = query.order_by(Task.deadline_at, Task.id)
+    if limit is not None:
+        query = query.limit(limit)
+
+    result = await db.execute(query)
+    return [
+        TaskDeadlineStats(
+            title=row.title,
+            description=row.description,
+            created_at=row.created_at,
+            days_until_deadline=row.days_until_deadline
+        ).model_dump(mode="json")
+        for row in result.all()
+    ], {}
+
+
 @router.get("/deadlines", response_model=List[TaskDeadlineStats])
 async def get_pending_tasks_deadline_stats(
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    within_days: Optional[int] = Query(None, ge=0, description="Только задачи с дедлайном в ближайшие N дней"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Максимальное количество задач"),
+    clock: Clock = Depends(get_request_clock),
+    current_user: User = Depends(get_token_user),
     db: AsyncSession = Depends(get_async_session)
 ) -> List[TaskDeadlineStats]:
-    # Получаем задачи со статусом pending с учетом прав доступа
-    if current_user.role.value == "admin":
-        # Администраторы видят все незавершенные задачи
-        result = await db.execute(
-            select(Task).where(Task.completed == False)
-        )
-    else:
-        # Обычные пользователи видят только свои незавершенные задачи
-        result = await db.execute(
-            select(Task).where(
-                Task.completed == False,
-                Task.user_id == current_user.id
-            )
-        )
-    pending_tasks = result.scalars().all()
-    
-    deadline_stats = []
-    for task in pending_tasks:
-        # Пропускаем задачи без дедлайна
-        if not task.deadline_at:
-            continue
-            
-        days_until_deadline = task.days_until_deadline
-        deadline_stats.append(TaskDeadlineStats(
-            title=task.title,
-            description=task.description,
-            created_at=task.created_at,
-            days_until_deadline=days_until_deadline
-        ))
-    
-    # Сортируем по количеству дней до дедлайна (сначала самые срочные)
-    deadline_stats.sort(key=lambda x: x.days_until_deadline)
-    
-    return deadline_stats
\ No newline at end of file
+    # Дни до дедлайна, фильтрация и сортировка выполняются на стороне БД
+    params = {"within_days": within_days, "limit": limit, "today": clock.key}
+    return await conditional_json_response(
+        request, current_user, "stats/deadlines", params,
+        lambda: fetch_task_fingerprint(db, current_user),
+        lambda: _deadline_stats(db, current_user, clock, within_days, limit)
+    )
@@ -1,175 +1,382 @@
-from fastapi import APIRouter, HTTPException, Query, status, Response, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, status, Depends, Body, Request, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
+from dataclasses import asdict
+from typing import List, Optional
 from data import tasks_db
-from database import get_async_session
-from datetime import datetime
+from database import get_async_session, engine
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, delete, case, literal
 from models.task import Task
 from models.user import User
-from schemas import TaskCreate, TaskResponse, TaskUpdate
-from dependencies import get_current_user
+from schemas import TaskCreate, TaskResponse, TaskUpdate, TaskBatchUpdate, TaskBatchIds, TaskBatchResult, TaskSearchResult, TaskChanges, TaskImportResult
+from task_search import get_search_backend
+from task_sync import decode_sync_token, encode_sync_token, fetch_changes, record_tombstones
+from task_export import EXPORT_FORMATS, build_export_query, export_tasks, parse_export_format
+from task_import import import_tasks, open_text_stream, parse_import_format
+from task_serializers import TASK_COLUMNS, FastJSONResponse, task_record, task_records
+from task_events import commit_tasks_changed, notify_tasks_imported
+from etags import conditional_json_response, etag_matches, make_etag, not_modified_response, ETAG_HEADER, CACHE_CONTROL
+from dependencies import get_current_user, get_token_user
+from clock import Clock, current_clock, get_request_clock, make_clock
+from sql_functions import utcnow
+from task_queries import (
+    TaskFilters,
+    get_task_filters,
+    fetch_task_page,
+    fetch_task_fingerprint,
+    apply_task_scope,
+    urgency_boundary,
+    urgency_expr,
+    quadrant_expr,
+    calculate_urgency,
+    determine_quadrant,
+    parse_quadrant,
+    parse_status,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+)
 
 router = APIRouter(
     prefix="/tasks",
-    tags=["tasks"]
+    tags=["tasks"],
+    # Часы запроса: is_urgent и days_until_deadline считаются в часовом поясе клиента
+    dependencies=[Depends(get_request_clock)]
 )
 
-def calculate_days_until_deadline(deadline_at):
-    if deadline_at is None:
-        return None
-    today = datetime.now().date()
-    deadline_date = deadline_at.date() if isinstance(deadline_at, datetime) else deadline_at
-    return (deadline_date - today).days
-
-def calculate_urgency(deadline_at):
-    if deadline_at is None:
-        return False
-    today = datetime.now().date()
-    deadline_date = deadline_at.date() if isinstance(deadline_at, datetime) else deadline_at
-    days_until_deadline = (deadline_date - today).days
-    return days_until_deadline <= 3
-
-def determine_quadrant(is_important, is_urgent):
-    if is_important and is_urgent:
-        return "Q1"
-    elif is_important and not is_urgent:
-        return "Q2"
-    elif not is_important and is_urgent:
-        return "Q3"
-    else:
-        return "Q4"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_BATCH_SIZE = 500
+
+def task_response(task, status_code: int = status.HTTP_200_OK, headers: Optional[dict] = None) -> FastJSONResponse:
+    # Ответ с одной задачей без повторной проверки через response_model
+    return FastJSONResponse(task_record(task, current_clock()), status_code=status_code, headers=headers)
+
+
+async def list_tasks_page(
+    endpoint: str,
+    request: Request,
+    db: AsyncSession,
+    current_user: User,
+    filters: TaskFilters,
+    cursor: Optional[str],
+    limit: int,
+) -> Response:
+    async def produce():
+        # Выбираются только столбцы ответа, без объектов Task
+        rows, next_cursor = await fetch_task_page(db, current_user, filters, cursor, limit, TASK_COLUMNS)
+        # Курсор следующей страницы передается в заголовке, тело остается списком задач
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor is not None else {}
+        return task_records(rows), headers
+
+    # Дата входит в параметры: is_urgent и days_until_deadline меняются каждый день
+    params = {**asdict(filters), "cursor": cursor, "limit": limit, "today": current_clock().key}
+    return await conditional_json_response(
+        request, current_user, endpoint, params,
+        lambda: fetch_task_fingerprint(db, current_user, filters),
+        produce
+    )
+
 
 @router.get("", response_model=List[TaskResponse])
 async def get_all_tasks(
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    filters: TaskFilters = Depends(get_task_filters),
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(get_token_user),
     db: AsyncSession = Depends(get_async_session),
 ) -> List[TaskResponse]:
-    # Если пользователь - admin, показываем все задачи
-    print(current_user.role)
-    if current_user.role.value == "admin":
-        result = await db.execute(select(Task))
-    else:
-        # Обычные пользователи только свои задачи
-        result = await db.execute(
-            select(Task).where(Task.user_id == current_user.id)
-        )
-    tasks = result.scalars().all()
-    print([task.user_id for task in tasks])
-    return tasks
+    return await list_tasks_page("tasks", request, db, current_user, filters, cursor, limit)
 
 @router.get("/quadrant/{quadrant}", response_model=List[TaskResponse])
 async def get_tasks_by_quadrant(
     quadrant: str,
+    request: Request,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
     db: AsyncSession = Depends(get_async_session),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_token_user)
 ) -> List[TaskResponse]:
-    if quadrant not in ["Q1", "Q2", "Q3", "Q4"]:
-        raise HTTPException(
-            status_code=400,
-            detail="Неверный квадрант. Используйте: Q1, Q2, Q3, Q4"
-        )
-    
-    query = select(Task).where(Task.quadrant == quadrant)
-    
-    # Администраторы видят все задачи, пользователи — только свои
-    if current_user.role.value != "admin":
-        query = query.where(Task.user_id == current_user.id)
-    
-    result = await db.execute(query)
-    tasks = result.scalars().all()
-    return tasks
-
-@router.get("/search", response_model=List[TaskResponse])
+    filters = TaskFilters(quadrant=parse_quadrant(quadrant))
+    return await list_tasks_page("tasks/quadrant", request, db, current_user, filters, cursor, limit)
+
+@router.get("/search", response_model=List[TaskSearchResult])
 async def search_tasks(
     q: str = Query(..., min_length=2),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
     db: AsyncSession = Depends(get_async_session),
-    current_user: User = Depends(get_current_user),
-) -> List[TaskResponse]:
-    keyword = f"%{q.lower()}%"
-    condition = (Task.title.ilike(keyword)) | (Task.description.ilike(keyword))
-    
-    if current_user.role.value == "admin":
-        query = select(Task).where(condition)
-    else:
-        query = select(Task).where(
-            Task.user_id == current_user.id,
-            condition
-        )
+    current_user: User = Depends(get_token_user),
+) -> List[TaskSearchResult]:
+    # Полнотекстовый поиск с ранжированием (в SQLite — индекс в памяти)
+    backend = get_search_backend(engine)
+    hits = await backend.search(db, current_user, q, limit, offset)
 
-    result = await db.execute(query)
-    tasks = result.scalars().all()
-    
-    if not tasks:
+    if not hits and offset == 0:
         raise HTTPException(
             status_code=404,
             detail="По данному запросу ничего не найдено"
         )
-    return tasks
+    clock = current_clock()
+    return FastJSONResponse([
+        {**task_record(task, clock), "rank": rank, "snippet": snippet}
+        for task, rank, snippet in hits
+    ])
 
 @router.get("/today", response_model=List[TaskResponse])
 async def get_tasks_due_today(
+    request: Request,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    clock: Clock = Depends(get_request_clock),
     db: AsyncSession = Depends(get_async_session),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_token_user)
 ) -> List[TaskResponse]:
     """Get all tasks that are due today"""
-    from datetime import date
-    
-    today = date.today()
-    
-    # Build query based on user role
-    if current_user.role.value == "admin":
-        result = await db.execute(
-            select(Task).where(
-                Task.deadline_at.isnot(None)
-            )
-        )
-    else:
-        result = await db.execute(
-            select(Task).where(
-                Task.user_id == current_user.id,
-                Task.deadline_at.isnot(None)
-            )
-        )
-    
-    # Filter tasks where deadline is today
-    all_tasks = result.scalars().all()
-    tasks_due_today = [
-        task for task in all_tasks
-        if task.deadline_at.date() == today
-    ]
-    
-    return tasks_due_today
+    # Диапазон "сегодня" считается в часовом поясе клиента и проверяется в SQL
+    today_start, tomorrow_start = clock.today_window()
+    filters = TaskFilters(deadline_from=today_start, deadline_to=tomorrow_start)
+    return await list_tasks_page("tasks/today", request, db, current_user, filters, cursor, limit)
 
 @router.get("/status/{status}", response_model=List[TaskResponse])
 async def get_tasks_by_status(
     status: str,
+    request: Request,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
     db: AsyncSession = Depends(get_async_session),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_token_user)
 ) -> List[TaskResponse]:
-    if status not in ["completed", "pending"]:
-        raise HTTPException(status_code=404, detail="Недопустимый статус. Используйте: completed или pending")
-    is_completed = status == "completed"
-    if current_user.role.value == "admin":
-        result = await db.execute(
-            select(Task).where(Task.completed == is_completed)
-        )
-    else:
-        result = await db.execute(
-            select(Task).where(
-                Task.completed == is_completed,
-                Task.user_id == current_user.id
+    filters = TaskFilters(completed=parse_status(status))
+    return await list_tasks_page("tasks/status", request, db, current_user, filters, cursor, limit)
+
+
+@router.get("/changes", response_model=TaskChanges)
+async def get_task_changes(
+    since: Optional[str] = Query(None, description="Токен next_token из предыдущего ответа; без него — все задачи"),
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_token_user)
+) -> TaskChanges:
+    # Инкрементальная синхронизация: только изменения после токена
+    position = decode_sync_token(since) if since is not None else None
+    changed, deleted, next_position, has_more = await fetch_changes(db, current_user, position, limit)
+    return FastJSONResponse({
+        "changed": task_records(changed),
+        "deleted": deleted,
+        "next_token": encode_sync_token(next_position),
+        "has_more": has_more
+    })
+
+
+@router.get("/export")
+async def export_all_tasks(
+    export_format: str = Query("ndjson", alias="format", description="ndjson или csv"),
+    filters: TaskFilters = Depends(get_task_filters),
+    clock: Clock = Depends(get_request_clock),
+    db: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_token_user),
+) -> StreamingResponse:
+    # Те же фильтры и права, что у GET /tasks, но без загрузки всех задач в память
+    export_format = parse_export_format(export_format)
+    query = build_export_query(current_user, filters)
+    # Сессия запроса больше не нужна: выгрузка читает задачи в своей сессии
+    await db.close()
+    return StreamingResponse(
+        export_tasks(query, export_format, clock),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="tasks.{export_format}"'},
+    )
+
+
+@router.post("/import", response_model=TaskImportResult)
+async def import_tasks_file(
+    file: UploadFile = File(..., description="Файл NDJSON или CSV с полями title, description, is_important, deadline_at"),
+    import_format: str = Query("ndjson", alias="format", description="ndjson или csv"),
+    owner_id: Optional[int] = Query(None, description="Владелец задач (только для администратора)"),
+    db: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user),
+) -> TaskImportResult:
+    import_format = parse_import_format(import_format)
+    user_id = current_user.id
+    if owner_id is not None and owner_id != current_user.id:
+        if current_user.role.value != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Нет доступа к задачам другого пользователя"
             )
+        if await db.get(User, owner_id) is None:
+            raise HTTPException(status_code=404, detail="Пользователь не найден")
+        user_id = owner_id
+
+    # Файл читается построчно, строки записываются пачками по IMPORT_BATCH_SIZE
+    result = await import_tasks(db, open_text_stream(file.file), import_format, user_id)
+    if result["imported"]:
+        await notify_tasks_imported(engine, user_id)
+    return result
+
+
+# Пакетные операции объявлены до маршрутов /{task_id}, чтобы путь /batch
+# не принимался за идентификатор задачи
+
+async def classify_missing_tasks(db: AsyncSession, ids: List[int]) -> dict:
+    # Для задач, не попавших под изменение, одним запросом определяем причину
+    if not ids:
+        return {}
+    result = await db.execute(select(Task.id).where(Task.id.in_(ids)))
+    existing = set(result.scalars().all())
+    return {task_id: "forbidden" if task_id in existing else "not_found" for task_id in ids}
+
+
+@router.post("/batch", response_model=List[TaskBatchResult], status_code=status.HTTP_201_CREATED)
+async def create_tasks_batch(
+    tasks: List[TaskCreate] = Body(..., min_length=1, max_length=MAX_BATCH_SIZE),
+    db: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user)
+) -> List[TaskBatchResult]:
+    server_clock = make_clock()
+    rows = [
+        {
+            "title": task.title,
+            "description": task.description,
+            "is_important": task.is_important,
+            "deadline_at": task.deadline_at,
+            "quadrant": determine_quadrant(task.is_important, calculate_urgency(task.deadline_at, server_clock)),
+            "completed": False,
+            "user_id": current_user.id
+        }
+        for task in tasks
+    ]
+    # Один многострочный INSERT ... RETURNING
+    result = await db.scalars(
+        insert(Task).returning(Task, sort_by_parameter_order=True).execution_options(render_nulls=True),
+        rows
+    )
+    created = result.all()
+    await commit_tasks_changed(db, "task.created", created)
+    clock = current_clock()
+    return FastJSONResponse(
+        [{"id": task.id, "status": "created", "task": task_record(task, clock)} for task in created],
+        status_code=status.HTTP_201_CREATED
+    )
+
+
+@router.patch("/batch", response_model=List[TaskBatchResult])
+async def update_tasks_batch(
+    updates: List[TaskBatchUpdate] = Body(..., min_length=1, max_length=MAX_BATCH_SIZE),
+    db: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user)
+) -> List[TaskBatchResult]:
+    ids = [item.id for item in updates]
+    # Значения каждого поля по идентификаторам задач; при повторе идентификатора
+    # в пакете поля применяются по порядку, как при последовательных изменениях
+    columns: dict = {}
+    quadrants = {}
+    boundary = urgency_boundary(make_clock().now)
+    for item in updates:
+        update_data = item.model_dump(exclude_unset=True, exclude={"id"})
+        for field, value in update_data.items():
+            columns.setdefault(field, {})[item.id] = value
+    importance, deadlines = columns.get("is_important", {}), columns.get("deadline_at", {})
+    for task_id in {*importance, *deadlines}:
+        # Как в update_task: неизменные значения берутся из текущей строки
+        is_important = importance.get(task_id, Task.is_important)
+        if task_id in deadlines:
+            is_urgent = calculate_urgency(deadlines[task_id])
+        else:
+            is_urgent = urgency_expr(Task.deadline_at, boundary)
+        quadrants[task_id] = quadrant_expr(is_important, is_urgent)
+
+    values = {
+        field: case(
+            {task_id: literal(value, Task.__table__.c[field].type) for task_id, value in by_id.items()},
+            value=Task.id,
+            else_=getattr(Task, field),
         )
-    tasks = result.scalars().all()
-    return tasks
+        for field, by_id in columns.items()
+    }
+    if quadrants:
+        values["quadrant"] = case(quadrants, value=Task.id, else_=Task.quadrant)
+
+    tasks = {}
+    changed = {task_id for by_id in columns.values() for task_id in by_id}
+    if changed:
+        # Один UPDATE ... SET поле = CASE id ... RETURNING с проверкой владельца в WHERE
+        statement = apply_task_scope(
+            update(Task).where(Task.id.in_(changed)),
+            current_user
+        ).values(**values).returning(Task)
+        result = await db.scalars(statement.execution_options(synchronize_session=False))
+        tasks = {task.id: task for task in result.all()}
+    unchanged = set(ids) - changed
+    if unchanged:
+        # Элементы без полей не меняют строку (и updated_at), задача только читается
+        result = await db.scalars(apply_task_scope(select(Task).where(Task.id.in_(unchanged)), current_user))
+        tasks.update((task.id, task) for task in result.all())
+    missing = await classify_missing_tasks(db, [task_id for task_id in set(ids) if task_id not in tasks])
+
+    updated = [task for task_id, task in tasks.items() if task_id in changed]
+    if updated:
+        await commit_tasks_changed(db, "task.updated", updated)
+    clock = current_clock()
+    return FastJSONResponse([
+        {"id": item.id, "status": "updated", "task": task_record(tasks[item.id], clock)}
+        if item.id in tasks else {"id": item.id, "status": missing[item.id], "task": None}
+        for item in updates
+    ])
+
+
+@router.patch("/batch/complete", response_model=List[TaskBatchResult])
+async def complete_tasks_batch(
+    batch: TaskBatchIds,
+    db: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user)
+) -> List[TaskBatchResult]:
+    statement = apply_task_scope(
+        update(Task).where(Task.id.in_(batch.ids)),
+        current_user
+    ).values(completed=True, completed_at=utcnow()).returning(Task)
+    result = await db.scalars(statement.execution_options(synchronize_session=False))
+    completed = {task.id: task for task in result.all()}
+    await commit_tasks_changed(db, "task.completed", completed.values())
+
+    missing = await classify_missing_tasks(db, [task_id for task_id in set(batch.ids) if task_id not in completed])
+    clock = current_clock()
+    return FastJSONResponse([
+        {"id": task_id, "status": "completed", "task": task_record(completed[task_id], clock)}
+        if task_id in completed else {"id": task_id, "status": missing[task_id], "task": None}
+        for task_id in batch.ids
+    ])
+
+
+@router.delete("/batch", response_model=List[TaskBatchResult])
+async def delete_tasks_batch(
+    batch: TaskBatchIds,
+    db: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user)
+) -> List[TaskBatchResult]:
+    statement = apply_task_scope(
+        delete(Task).where(Task.id.in_(batch.ids)),
+        current_user
+    ).returning(Task.id, Task.user_id)
+    result = await db.execute(statement.execution_options(synchronize_session=False))
+    deleted_rows = result.all()
+    deleted = {row.id for row in deleted_rows}
+    await record_tombstones(db, deleted_rows)
+    await commit_tasks_changed(db, "task.deleted", deleted_rows)
+
+    missing = await classify_missing_tasks(db, [task_id for task_id in set(batch.ids) if task_id not in deleted])
+    return [
+        {"id": task_id, "status": "deleted" if task_id in deleted else missing[task_id]}
+        for task_id in batch.ids
+    ]
 
 
 @router.get("/{task_id}", response_model=TaskResponse)
 async def get_task_by_id(
     task_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_async_session),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_token_user)
 ) -> TaskResponse:
     result = await db.execute(
         select(Task).where(Task.id == task_id)
@@ -182,7 +389,11 @@ async def get_task_by_id(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Нет доступа к этой задаче",
         )
-    return task
+    # ETag проверяется после проверки доступа, до сериализации задачи
+    etag = make_etag("task", task.id, task.updated_at, current_clock().key)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified_response(etag)
+    return task_response(task, headers={ETAG_HEADER: etag, "Cache-Control": CACHE_CONTROL})
 
 
 @router.post("/", response_model=TaskResponse, status_code=status.HTTP_201_CREATED)
@@ -205,9 +416,21 @@ async def create_task(
     )
 
     db.add(new_task)
-    await db.commit()
-    await db.refresh(new_task)
-    return new_task
+    # INSERT ... RETURNING выполняется до фиксации: идентификатор нужен для события
+    await db.flush()
+    await commit_tasks_changed(db, "task.created", [new_task])
+    return task_response(new_task, status_code=status.HTTP_201_CREATED)
+
+async def raise_task_access_error(db: AsyncSession, task_id: int):
+    # Изменение не затронуло ни одной строки: задачи нет или она чужая
+    result = await db.execute(select(Task.id).where(Task.id == task_id))
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Нет доступа к этой задаче"
+    )
+
 
 @router.put("/{task_id}", response_model=TaskResponse)
 async def update_task(
@@ -216,33 +439,35 @@ async def update_task(
     db: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ) -> TaskResponse:
-    result = await db.execute(
-        select(Task).where(Task.id == task_id)
-    )
-    task = result.scalar_one_or_none()
-    if not task:
-        raise HTTPException(status_code=404, detail="Задача не найдена")
-    if current_user.role.value != "admin" and task.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Нет доступа к этой задаче"
-        )
-
-    update_data = task_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(task, field, value)
-
-    if "is_important" in update_data or "deadline_at" in update_data:
-        is_urgent = calculate_urgency(task.deadline_at)
-        task.quadrant = determine_quadrant(task.is_important, is_urgent)
+    values = task_update.model_dump(exclude_unset=True)
+    if "is_important" in values or "deadline_at" in values:
+        # Значения, которые не меняются, берутся из текущей строки прямо в UPDATE
+        is_important = values.get("is_important", Task.is_important)
+        if "deadline_at" in values:
+            is_urgent = calculate_urgency(values["deadline_at"])
+        else:
+            is_urgent = urgency_expr(Task.deadline_at, urgency_boundary(make_clock().now))
+        values["quadrant"] = quadrant_expr(is_important, is_urgent)
 
-    await db.commit()
-    await db.refresh(task)
-
-    task_dict = task.__dict__.copy()
-    task_dict['is_urgent'] = task.is_urgent
-    task_dict['days_until_deadline'] = calculate_days_until_deadline(task.deadline_at)
-    return TaskResponse(**task_dict)
+    if values:
+        # Один UPDATE ... RETURNING с проверкой владельца в WHERE
+        statement = apply_task_scope(
+            update(Task).where(Task.id == task_id),
+            current_user
+        ).values(**values).returning(Task)
+        result = await db.scalars(statement.execution_options(synchronize_session=False))
+    else:
+        result = await db.scalars(
+            apply_task_scope(select(Task).where(Task.id == task_id), current_user)
+        )
+    task = result.one_or_none()
+    if task is None:
+        await raise_task_access_error(db, task_id)
+    if not values:
+        # Пустое обновление ничего не меняет: кэш и подписчики не затрагиваются
+        return task_response(task)
+    await commit_tasks_changed(db, "task.updated", [task])
+    return task_response(task)
 
 
 @router.patch("/{task_id}/complete", response_model=TaskResponse)
@@ -251,27 +476,16 @@ async def complete_task(
     db: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ) -> TaskResponse:
-    result = await db.execute(
-        select(Task).where(Task.id == task_id)
-    )
-    task = result.scalar_one_or_none()
-    if not task:
-        raise HTTPException(status_code=404, detail="Задача не найдена")
-    if current_user.role.value != "admin" and task.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Нет доступа к этой задаче"
-        )
-    task.completed = True
-    task.completed_at = datetime.now()
-
-    await db.commit()
-    await db.refresh(task)
-
-    task_dict = task.__dict__.copy()
-    task_dict['is_urgent'] = task.is_urgent
-    task_dict['days_until_deadline'] = calculate_days_until_deadline(task.deadline_at)
-    return TaskResponse(**task_dict)
+    statement = apply_task_scope(
+        update(Task).where(Task.id == task_id),
+        current_user
+    ).values(completed=True, completed_at=utcnow()).returning(Task)
+    result = await db.scalars(statement.execution_options(synchronize_session=False))
+    task = result.one_or_none()
+    if task is None:
+        await raise_task_access_error(db, task_id)
+    await commit_tasks_changed(db, "task.completed", [task])
+    return task_response(task)
 
 @router.delete("/{task_id}", status_code=status.HTTP_200_OK)
 async def delete_task(
@@ -279,28 +493,19 @@ async def delete_task(
     db: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ) -> dict:
-    result = await db.execute(
-        select(Task).where(Task.id == task_id)
-    )
-    task = result.scalar_one_or_none()
-    if not task:
-        raise HTTPException(status_code=404, detail="Задача не найдена")
-    if current_user.role.value != "admin" and task.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Нет доступа к этой задаче"
-        )
-
-    deleted_task_info = {
-        "id": task.id,
-        "title": task.title
-    }
-
-    await db.delete(task)
-    await db.commit()
+    statement = apply_task_scope(
+        delete(Task).where(Task.id == task_id),
+        current_user
+    ).returning(Task.id, Task.title, Task.user_id)
+    result = await db.execute(statement.execution_options(synchronize_session=False))
+    deleted_task = result.one_or_none()
+    if deleted_task is None:
+        await raise_task_access_error(db, task_id)
+    await record_tombstones(db, [deleted_task])
+    await commit_tasks_changed(db, "task.deleted", [deleted_task])
 
     return {
         "message": "Задача успешно удалена",
-        "id": deleted_task_info["id"],
-        "title": deleted_task_info["title"]
-    }
\ No newline at end of file
+        "id": deleted_task.id,
+        "title": deleted_task.title
+    }
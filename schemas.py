@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class TaskBase(BaseModel):
@@ -57,6 +57,9 @@ class TaskResponse(TaskBase):
     created_at: datetime = Field(
         ...,
         description="Дата и время создания задачи")
+    updated_at: Optional[datetime] = Field(
+        None,
+        description="Дата и время последнего изменения задачи")
     completed_at: Optional[datetime] = Field(
         None,
         description="Дата и время завершения задачи")
@@ -70,8 +73,75 @@ class TaskResponse(TaskBase):
     class Config:
         from_attributes = True
 
+class TaskSearchResult(TaskResponse):
+    rank: float = Field(
+        ...,
+        description="Релевантность результата")
+    snippet: Optional[str] = Field(
+        None,
+        description="Фрагмент текста с подсвеченными совпадениями (<b>...</b>)")
+
 class TaskDeadlineStats(BaseModel):
     title: str = Field(..., description="Название задачи")
     description: Optional[str] = Field(None, description="Описание задачи")
     created_at: datetime = Field(..., description="Дата создания задачи")
-    days_until_deadline: int = Field(..., description="Дней до дедлайна")
\ No newline at end of file
+    days_until_deadline: int = Field(..., description="Дней до дедлайна")
+
+class TaskBatchUpdate(TaskUpdate):
+    id: int = Field(
+        ...,
+        description="Идентификатор изменяемой задачи")
+
+class TaskBatchIds(BaseModel):
+    ids: List[int] = Field(
+        ...,
+        min_length=1,
+        max_length=500,
+        description="Идентификаторы задач")
+
+class TaskBatchResult(BaseModel):
+    id: Optional[int] = Field(
+        None,
+        description="Идентификатор задачи")
+    status: str = Field(
+        ...,
+        description="Результат: created, updated, completed, deleted, not_found или forbidden",
+        examples=["updated"])
+    task: Optional[TaskResponse] = Field(
+        None,
+        description="Задача после изменения")
+
+
+class TaskChanges(BaseModel):
+    changed: List[TaskResponse] = Field(
+        ...,
+        description="Задачи, созданные или измененные после токена")
+    deleted: List[int] = Field(
+        ...,
+        description="Идентификаторы удаленных задач")
+    next_token: str = Field(
+        ...,
+        description="Токен для следующего запроса изменений")
+    has_more: bool = Field(
+        ...,
+        description="Есть ли еще изменения (запросите их с next_token)")
+
+
+class TaskImportError(BaseModel):
+    line: int = Field(
+        ...,
+        description="Номер строки в файле")
+    errors: List[str] = Field(
+        ...,
+        description="Ошибки проверки строки")
+
+class TaskImportResult(BaseModel):
+    imported: int = Field(
+        ...,
+        description="Количество созданных задач")
+    failed: int = Field(
+        ...,
+        description="Количество строк с ошибками")
+    errors: List[TaskImportError] = Field(
+        ...,
+        description="Ошибки по строкам (не более 1000 первых)")
@@ -43,6 +43,20 @@ class UserResponse(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = Field(
+        None,
+        description="Время жизни токена доступа в секундах"
+    )
+
+
+# Схема обмена refresh-токена и выхода
+class RefreshRequest(BaseModel):
+    refresh_token: str = Field(
+        ...,
+        min_length=1,
+        description="Refresh-токен, выданный при входе"
+    )
 
 
 # Данные, извлекаемые из токена
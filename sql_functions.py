@@ -0,0 +1,144 @@
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import BigInteger, Date, DateTime, Float, Integer
+from zoneinfo import ZoneInfo
+
+from clock import Clock
+
+
+# Текущее время на стороне БД.
+# В SQLite CURRENT_TIMESTAMP хранится без микросекунд, а SQLAlchemy сохраняет
+# даты с микросекундами, из-за чего строковое сравнение (например, в keyset-
+# пагинации) дает неверный результат. Поэтому для SQLite формат выравнивается.
+class utcnow(FunctionElement):
+    type = DateTime(timezone=True)
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def _utcnow_default(element, compiler, **kw):
+    return "now()"
+
+
+@compiles(utcnow, "sqlite")
+def _utcnow_sqlite(element, compiler, **kw):
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
+# Разница между двумя отметками времени в секундах
+class seconds_between(FunctionElement):
+    type = Float()
+    inherit_cache = True
+
+
+@compiles(seconds_between)
+def _seconds_between_default(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return "EXTRACT(EPOCH FROM (%s - %s))" % (compiler.process(end, **kw), compiler.process(start, **kw))
+
+
+@compiles(seconds_between, "sqlite")
+def _seconds_between_sqlite(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return "((julianday(%s) - julianday(%s)) * 86400.0)" % (compiler.process(end, **kw), compiler.process(start, **kw))
+
+
+# Разница календарных дат start и end в часовом поясе zone (отрицательная, если end раньше start),
+# как в Clock.days_until. В PostgreSQL даты берутся в поясе клиента, поэтому дедлайн
+# позже сегодня — это 0 дней, а переход на летнее время не сдвигает счет.
+# В SQLite значения хранятся без пояса и сравниваются как записаны.
+class days_between(FunctionElement):
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(days_between)
+def _days_between_default(element, compiler, **kw):
+    start, end, zone = list(element.clauses)
+    zone = compiler.process(zone, **kw)
+    return "(CAST((%s AT TIME ZONE %s) AS DATE) - CAST((%s AT TIME ZONE %s) AS DATE))" % (
+        compiler.process(end, **kw), zone, compiler.process(start, **kw), zone)
+
+
+@compiles(days_between, "sqlite")
+def _days_between_sqlite(element, compiler, **kw):
+    start, end, _ = list(element.clauses)
+    return "CAST(julianday(date(%s)) - julianday(date(%s)) AS INTEGER)" % (
+        compiler.process(end, **kw), compiler.process(start, **kw))
+
+
+# Календарная дата отметки времени в часовом поясе клиента.
+# PostgreSQL переводит значение в пояс по имени, с учетом летнего времени.
+# В SQLite отметки, записанные utcnow() (created_at, completed_at), хранятся
+# в UTC без пояса, поэтому к ним прибавляется текущее смещение пояса.
+class local_date(FunctionElement):
+    type = Date()
+    inherit_cache = True
+
+
+@compiles(local_date)
+def _local_date_default(element, compiler, **kw):
+    value, zone, _ = list(element.clauses)
+    return "CAST((%s AT TIME ZONE %s) AS DATE)" % (compiler.process(value, **kw), compiler.process(zone, **kw))
+
+
+@compiles(local_date, "sqlite")
+def _local_date_sqlite(element, compiler, **kw):
+    value, _, offset = list(element.clauses)
+    return "date(%s, %s)" % (compiler.process(value, **kw), compiler.process(offset, **kw))
+
+
+def zone_name(clock: Clock) -> str:
+    """Часовой пояс часов для AT TIME ZONE"""
+    if isinstance(clock.tz, ZoneInfo):
+        return clock.tz.key
+    # Пояс сервера без имени — фиксированное смещение в формате POSIX,
+    # где знак обратный: UTC-03:00 означает на 3 часа восточнее UTC
+    minutes = int(clock.now.utcoffset().total_seconds()) // 60
+    sign = "-" if minutes >= 0 else "+"
+    return f"UTC{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}"
+
+
+def date_in_zone(value, clock: Clock) -> local_date:
+    minutes = int(clock.now.utcoffset().total_seconds()) // 60
+    return local_date(value, zone_name(clock), f"{minutes:+d} minutes")
+
+
+# Номер изменения для синхронизации задач.
+# В PostgreSQL — идентификатор текущей транзакции: все строки, измененные
+# в одной транзакции, получают один номер. В SQLite записи сериализуются
+# блокировкой БД, поэтому достаточно следующего номера после максимального.
+class current_change_seq(FunctionElement):
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(current_change_seq)
+def _current_change_seq_default(element, compiler, **kw):
+    return "pg_current_xact_id()::text::bigint"
+
+
+@compiles(current_change_seq, "sqlite")
+def _current_change_seq_sqlite(element, compiler, **kw):
+    return (
+        "(SELECT coalesce(max(seq), 0) + 1 FROM ("
+        "SELECT max(change_seq) AS seq FROM tasks "
+        "UNION ALL SELECT max(change_seq) FROM task_tombstones))"
+    )
+
+
+# Граница стабильных номеров изменений: все транзакции с меньшим номером
+# уже завершены, поэтому строки с номером ниже границы не появятся задним числом
+class change_horizon(FunctionElement):
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(change_horizon)
+def _change_horizon_default(element, compiler, **kw):
+    return "pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+
+
+@compiles(change_horizon, "sqlite")
+def _change_horizon_sqlite(element, compiler, **kw):
+    return "9223372036854775807"
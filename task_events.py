@@ -0,0 +1,294 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Iterable, List, Optional
+from uuid import uuid4
+
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, select, func, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.types import Text
+
+from models.user import User
+from response_cache import response_cache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# memory — события только внутри процесса, postgres — LISTEN/NOTIFY между воркерами,
+# auto — выбор по диалекту БД
+EVENTS_BROKER = os.getenv("EVENTS_BROKER", "auto")
+# LISTEN требует сессионного соединения: для transaction pooler укажите прямой адрес БД
+EVENTS_LISTEN_URL = os.getenv("EVENTS_LISTEN_URL")
+EVENTS_CHANNEL = "task_events"
+# Очередь одного подключения; при переполнении подключение закрывается,
+# и клиент продолжает с Last-Event-ID
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "100"))
+# Сколько последних событий хранится для продолжения после переподключения
+EVENTS_HISTORY_SIZE = int(os.getenv("EVENTS_HISTORY_SIZE", "1000"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+# Размер NOTIFY ограничен 8000 байт, поэтому большие изменения делятся на части
+MAX_TASK_IDS_PER_EVENT = 500
+
+# Событие-указание клиенту выполнить синхронизацию через GET /tasks/changes:
+# часть событий могла быть потеряна
+RESET_EVENT_TYPE = "reset"
+
+
+def make_event(event_type: str, user_id: Optional[int], task_ids: List[int]) -> dict:
+    return {
+        # Идентификатор назначает издатель, поэтому он одинаков во всех воркерах
+        "id": f"{time.time_ns()}-{uuid4().hex[:8]}",
+        "type": event_type,
+        "user_id": user_id,
+        "task_ids": task_ids,
+    }
+
+
+class Subscription:
+    """Подписка одного подключения: задачи пользователя или все задачи для администратора"""
+
+    def __init__(self, current_user: User, buffer_size: int):
+        self.user_id = current_user.id
+        self.is_admin = current_user.role.value == "admin"
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.backlog: List[dict] = []
+        self.overflowed = False
+
+    def wants(self, event: dict) -> bool:
+        return self.is_admin or event["type"] == RESET_EVENT_TYPE or event["user_id"] == self.user_id
+
+    def push(self, event: dict) -> None:
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Медленный клиент: отключаем его, а не копим события без ограничений
+            self.overflowed = True
+
+    async def events(self, heartbeat: float = EVENTS_HEARTBEAT_SECONDS):
+        """События подписки; None — пора отправить heartbeat"""
+        for event in self.backlog:
+            yield event
+        self.backlog = []
+        while not self.overflowed:
+            try:
+                event = await asyncio.wait_for(self.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if self.overflowed:
+                return
+            yield event
+
+
+class EventHub:
+    """Раздача событий подписчикам текущего процесса"""
+
+    def __init__(self, history_size: int = EVENTS_HISTORY_SIZE):
+        self._subscriptions: set = set()
+        self._history: deque = deque(maxlen=history_size)
+
+    def dispatch(self, event: dict) -> None:
+        self._history.append(event)
+        for subscription in self._subscriptions:
+            if subscription.wants(event):
+                subscription.push(event)
+
+    def subscribe(self, current_user: User, last_event_id: Optional[str] = None) -> Subscription:
+        subscription = Subscription(current_user, EVENTS_BUFFER_SIZE)
+        # Подписка и снимок истории выполняются без await, поэтому
+        # ни одно событие не будет пропущено или выдано дважды
+        self._subscriptions.add(subscription)
+        if last_event_id is not None:
+            history = list(self._history)
+            ids = [event["id"] for event in history]
+            if last_event_id in ids:
+                missed = history[ids.index(last_event_id) + 1:]
+                subscription.backlog = [event for event in missed if subscription.wants(event)]
+            else:
+                subscription.backlog = [make_event(RESET_EVENT_TYPE, None, [])]
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+
+    def stats(self) -> dict:
+        return {
+            "subscriptions": len(self._subscriptions),
+            "history": len(self._history),
+        }
+
+
+event_hub = EventHub()
+
+
+class InProcessBroker:
+    """События доставляются только подписчикам этого процесса (один воркер, тесты)"""
+
+    def __init__(self, hub: EventHub):
+        self.hub = hub
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, event: dict) -> None:
+        self.hub.dispatch(event)
+
+    async def publish_in_transaction(self, db: AsyncSession, events: List[dict]) -> None:
+        # Подписчики получают события только после фиксации (publish_committed)
+        pass
+
+    def publish_committed(self, events: List[dict]) -> None:
+        for event in events:
+            self.hub.dispatch(event)
+
+
+_NOTIFY_STATEMENT = text(
+    f"SELECT pg_notify('{EVENTS_CHANNEL}', payload) FROM unnest(:payloads) AS payload"
+).bindparams(bindparam("payloads", type_=ARRAY(Text)))
+
+
+class PostgresBroker:
+    """Рассылка событий всем воркерам через LISTEN/NOTIFY"""
+
+    RECONNECT_SECONDS = 5
+
+    def __init__(self, hub: EventHub, engine: AsyncEngine, listen_url: str):
+        self.hub = hub
+        self.engine = engine
+        self.listen_url = listen_url
+        self._task: Optional[asyncio.Task] = None
+
+    async def publish(self, event: dict) -> None:
+        # Событие вне транзакции изменения (импорт) — отдельная транзакция
+        async with self.engine.begin() as conn:
+            await conn.execute(select(func.pg_notify(EVENTS_CHANNEL, json.dumps(event))))
+
+    async def publish_in_transaction(self, db: AsyncSession, events: List[dict]) -> None:
+        # NOTIFY доставляется слушателям при фиксации транзакции изменения, поэтому
+        # все события запроса отправляются одним запросом в ней же, без отдельного
+        # соединения и транзакции
+        await db.execute(_NOTIFY_STATEMENT, {"payloads": [json.dumps(event) for event in events]})
+
+    def publish_committed(self, events: List[dict]) -> None:
+        # События приходят всем воркерам, включая этот, через LISTEN
+        pass
+
+    def _on_notification(self, connection, pid, channel, payload) -> None:
+        self.hub.dispatch(json.loads(payload))
+
+    async def _listen(self) -> None:
+        import asyncpg
+
+        reconnecting = False
+        while True:
+            try:
+                connection = await asyncpg.connect(self.listen_url)
+            except Exception as e:
+                logger.warning("Не удалось подключиться для LISTEN: %s", e)
+                await asyncio.sleep(self.RECONNECT_SECONDS)
+                continue
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda conn: closed.set())
+            try:
+                await connection.add_listener(EVENTS_CHANNEL, self._on_notification)
+                if reconnecting:
+                    # Пока соединения не было, события могли быть потеряны
+                    self.hub.dispatch(make_event(RESET_EVENT_TYPE, None, []))
+                await closed.wait()
+            finally:
+                await connection.close()
+            reconnecting = True
+            await asyncio.sleep(self.RECONNECT_SECONDS)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+_broker = None
+
+
+def get_event_broker(engine: AsyncEngine):
+    global _broker
+    if _broker is None:
+        kind = EVENTS_BROKER
+        if kind == "auto":
+            kind = "postgres" if engine.dialect.name == "postgresql" else "memory"
+        if kind == "postgres":
+            listen_url = EVENTS_LISTEN_URL or make_url(engine.url).set(drivername="postgresql").render_as_string(hide_password=False)
+            _broker = PostgresBroker(event_hub, engine, listen_url)
+        elif kind == "memory":
+            _broker = InProcessBroker(event_hub)
+        else:
+            raise RuntimeError(f"Неизвестный EVENTS_BROKER: {EVENTS_BROKER}")
+    return _broker
+
+
+async def _publish(engine: AsyncEngine, event: dict) -> None:
+    try:
+        await get_event_broker(engine).publish(event)
+    except Exception:
+        # Изменение уже зафиксировано: ошибка доставки не должна ломать запрос
+        logger.exception("Ошибка публикации события %s", event["type"])
+
+
+def _change_events(event_type: str, rows: Iterable) -> dict:
+    by_user: dict = {}
+    for row in rows:
+        by_user.setdefault(row.user_id, []).append(row.id)
+    return {
+        user_id: [
+            make_event(event_type, user_id, task_ids[start:start + MAX_TASK_IDS_PER_EVENT])
+            for start in range(0, len(task_ids), MAX_TASK_IDS_PER_EVENT)
+        ]
+        for user_id, task_ids in by_user.items()
+    }
+
+
+async def commit_tasks_changed(db: AsyncSession, event_type: str, rows: Iterable) -> None:
+    """Фиксирует транзакцию с изменением задач и уведомляет о нем.
+
+    rows — задачи или строки с полями id и user_id (у новых задач id появляется
+    после flush). События, по одному на владельца, отправляются в той же
+    транзакции; кэш ответов владельцев сбрасывается после фиксации.
+    """
+    events_by_user = _change_events(event_type, rows)
+    events = [event for user_events in events_by_user.values() for event in user_events]
+    broker = get_event_broker(db.bind)
+    if events:
+        await broker.publish_in_transaction(db, events)
+    await db.commit()
+    if not events:
+        return
+
+    await response_cache.invalidate_users(events_by_user)
+    try:
+        broker.publish_committed(events)
+    except Exception:
+        logger.exception("Ошибка публикации события %s", event_type)
+
+
+async def notify_tasks_imported(engine: AsyncEngine, user_id: int) -> None:
+    # Идентификаторы импортированных задач не передаются: клиенты получают их через /tasks/changes
+    await response_cache.invalidate_users([user_id])
+    await _publish(engine, make_event("task.imported", user_id, []))
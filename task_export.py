@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+import os
+from typing import AsyncIterator, List
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from sqlalchemy import select, Select
+
+from clock import Clock
+from database import AsyncSessionLocal
+from models.task import Task
+from models.user import User
+from task_queries import TaskFilters, apply_task_scope, apply_task_filters, deadline_is_urgent
+
+load_dotenv()
+
+# Сколько строк читается из курсора БД и отправляется клиенту за один раз
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# Выбираются отдельные столбцы, а не объекты Task: строки не попадают
+# в identity map сессии, и память не растет с размером выгрузки
+EXPORT_COLUMNS = [
+    Task.id,
+    Task.title,
+    Task.description,
+    Task.is_important,
+    Task.deadline_at,
+    Task.quadrant,
+    Task.completed,
+    Task.created_at,
+    Task.updated_at,
+    Task.completed_at,
+    Task.user_id,
+]
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS] + ["is_urgent", "days_until_deadline"]
+
+
+def parse_export_format(export_format: str) -> str:
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Неверный формат. Используйте: ndjson или csv"
+        )
+    return export_format
+
+
+def _export_record(row, clock: Clock) -> dict:
+    record = dict(row._mapping)
+    days_until_deadline = clock.days_until(record["deadline_at"])
+    record["is_urgent"] = deadline_is_urgent(days_until_deadline)
+    record["days_until_deadline"] = days_until_deadline
+    for field in ("deadline_at", "created_at", "updated_at", "completed_at"):
+        if record[field] is not None:
+            record[field] = record[field].isoformat()
+    return record
+
+
+def _format_chunk(records: List[dict], export_format: str) -> str:
+    if export_format == "ndjson":
+        return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+    buffer = io.StringIO()
+    csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS).writerows(records)
+    return buffer.getvalue()
+
+
+def build_export_query(current_user: User, filters: TaskFilters) -> Select:
+    # Строится до начала ответа, чтобы ошибки доступа вернулись обычным статусом
+    query = apply_task_scope(select(*EXPORT_COLUMNS), current_user, filters.owner_id)
+    return apply_task_filters(query, filters).order_by(Task.created_at, Task.id)
+
+
+async def export_tasks(query: Select, export_format: str, clock: Clock) -> AsyncIterator[str]:
+    """Выгрузка задач частями по EXPORT_CHUNK_SIZE строк через серверный курсор"""
+    if export_format == "csv":
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS).writeheader()
+        yield buffer.getvalue()
+
+    # Собственная сессия живет столько же, сколько выгрузка
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        async for rows in result.partitions():
+            yield _format_chunk([_export_record(row, clock) for row in rows], export_format)
@@ -0,0 +1,142 @@
+import asyncio
+import csv
+import io
+import itertools
+import json
+import os
+from typing import IO, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from clock import make_clock
+from models.task import Task
+from schemas import TaskCreate
+from sql_functions import current_change_seq
+from task_queries import calculate_urgency, determine_quadrant
+
+load_dotenv()
+
+# Сколько строк проверяется и записывается за одну транзакцию
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+# Подробности сохраняются только для первых ошибок, счетчик ошибок точный
+MAX_IMPORT_ERRORS = 1000
+
+IMPORT_FORMATS = ["ndjson", "csv"]
+
+# Порядок столбцов для COPY
+COPY_COLUMNS = ["title", "description", "is_important", "deadline_at", "quadrant", "completed", "user_id", "change_seq"]
+
+ImportRecord = Tuple[int, Optional[dict]]
+
+
+def parse_import_format(import_format: str) -> str:
+    if import_format not in IMPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Неверный формат. Используйте: ndjson или csv"
+        )
+    return import_format
+
+
+def read_records(stream: IO[str], import_format: str) -> Iterator[ImportRecord]:
+    """Построчное чтение файла: (номер строки, запись или None, если строка не разобрана)"""
+    if import_format == "ndjson":
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+    else:
+        reader = csv.DictReader(stream)
+        for record in reader:
+            # Пустые ячейки CSV означают отсутствие значения
+            yield reader.line_num, {
+                key: value if value != "" else None
+                for key, value in record.items() if key is not None
+            }
+
+
+def validate_batch(records: List[ImportRecord], user_id: int) -> Tuple[List[dict], List[dict]]:
+    """Проверка строк схемой TaskCreate и расчет квадрантов"""
+    rows, errors = [], []
+    server_clock = make_clock()
+    for line_number, record in records:
+        if record is None:
+            errors.append({"line": line_number, "errors": ["Строка не является объектом JSON"]})
+            continue
+        try:
+            task = TaskCreate.model_validate(record)
+        except ValidationError as e:
+            errors.append({
+                "line": line_number,
+                "errors": [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()]
+            })
+            continue
+        rows.append({
+            "title": task.title,
+            "description": task.description,
+            "is_important": task.is_important,
+            "deadline_at": task.deadline_at,
+            "quadrant": determine_quadrant(task.is_important, calculate_urgency(task.deadline_at, server_clock)),
+            "completed": False,
+            "user_id": user_id,
+        })
+    return rows, errors
+
+
+async def write_rows(session: AsyncSession, rows: List[dict]) -> None:
+    if not rows:
+        return
+    # Один номер изменения на пачку: все строки записываются одной транзакцией.
+    # Запрос через сессию начинает транзакцию, в которой затем выполняется COPY
+    change_seq = (await session.execute(select(current_change_seq()))).scalar()
+    if session.bind.dialect.driver == "asyncpg":
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            Task.__tablename__,
+            records=[tuple(row[column] for column in COPY_COLUMNS[:-1]) + (change_seq,) for row in rows],
+            columns=COPY_COLUMNS,
+        )
+    else:
+        # Многострочный INSERT пачками (insertmanyvalues); render_nulls не дает
+        # разбивать пачку на отдельные INSERT из-за строк с пустыми полями
+        await session.execute(
+            insert(Task).execution_options(render_nulls=True),
+            [{**row, "change_seq": change_seq} for row in rows]
+        )
+    await session.commit()
+
+
+async def import_tasks(session: AsyncSession, stream: IO[str], import_format: str, user_id: int) -> dict:
+    """Импорт задач из текстового потока; память ограничена размером пачки"""
+    records = read_records(stream, import_format)
+    imported, failed, errors = 0, 0, []
+
+    def next_batch():
+        # Чтение и проверка выполняются в потоке, чтобы не блокировать цикл событий
+        batch = list(itertools.islice(records, IMPORT_BATCH_SIZE))
+        return batch, validate_batch(batch, user_id)
+
+    while True:
+        batch, (rows, batch_errors) = await asyncio.to_thread(next_batch)
+        if not batch:
+            break
+        await write_rows(session, rows)
+        imported += len(rows)
+        failed += len(batch_errors)
+        errors.extend(batch_errors[:MAX_IMPORT_ERRORS - len(errors)])
+
+    return {"imported": imported, "failed": failed, "errors": errors}
+
+
+def open_text_stream(binary: IO[bytes]) -> IO[str]:
+    # utf-8-sig убирает BOM, который добавляют табличные редакторы
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", errors="replace", newline="")
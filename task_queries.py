@@ -0,0 +1,223 @@
+from fastapi import HTTPException, Query, status
+from sqlalchemy import select, func, tuple_, case, and_, true, false, Select
+from sqlalchemy.ext.asyncio import AsyncSession
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from typing import Optional, Tuple
+import base64
+import binascii
+import json
+
+from clock import Clock, make_clock
+from models.task import Task
+from models.user import User
+
+QUADRANTS = ["Q1", "Q2", "Q3", "Q4"]
+STATUSES = ["completed", "pending"]
+
+# Задача считается срочной, если до дедлайна осталось не больше URGENCY_DAYS дней
+URGENCY_DAYS = 3
+
+# Размер страницы по умолчанию и верхняя граница для параметра limit
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+@dataclass
+class TaskFilters:
+    quadrant: Optional[str] = None
+    completed: Optional[bool] = None
+    deadline_from: Optional[datetime] = None
+    deadline_to: Optional[datetime] = None
+    owner_id: Optional[int] = None
+
+
+def parse_quadrant(quadrant: str) -> str:
+    if quadrant not in QUADRANTS:
+        raise HTTPException(
+            status_code=400,
+            detail="Неверный квадрант. Используйте: Q1, Q2, Q3, Q4"
+        )
+    return quadrant
+
+
+def parse_status(task_status: str) -> bool:
+    if task_status not in STATUSES:
+        raise HTTPException(
+            status_code=404,
+            detail="Недопустимый статус. Используйте: completed или pending"
+        )
+    return task_status == "completed"
+
+
+# Зависимость FastAPI: фильтры списка задач из query-параметров
+def get_task_filters(
+    quadrant: Optional[str] = Query(None, description="Квадрант (Q1, Q2, Q3, Q4)"),
+    task_status: Optional[str] = Query(None, alias="status", description="completed или pending"),
+    deadline_from: Optional[datetime] = Query(None, description="Дедлайн не раньше"),
+    deadline_to: Optional[datetime] = Query(None, description="Дедлайн раньше"),
+    owner_id: Optional[int] = Query(None, description="Владелец задач (только для администратора)"),
+) -> TaskFilters:
+    return TaskFilters(
+        quadrant=parse_quadrant(quadrant) if quadrant is not None else None,
+        completed=parse_status(task_status) if task_status is not None else None,
+        deadline_from=deadline_from,
+        deadline_to=deadline_to,
+        owner_id=owner_id,
+    )
+
+
+def urgency_boundary(now: datetime) -> datetime:
+    # Срочны все задачи с дедлайном раньше начала дня (сегодня + URGENCY_DAYS + 1)
+    return datetime.combine(
+        now.date() + timedelta(days=URGENCY_DAYS + 1), time.min, tzinfo=now.tzinfo
+    )
+
+
+def deadline_is_urgent(days_until_deadline: Optional[int]) -> bool:
+    # Единое правило срочности для квадрантов, ответов API и выгрузки
+    return days_until_deadline is not None and days_until_deadline <= URGENCY_DAYS
+
+
+def calculate_urgency(deadline_at, clock: Optional[Clock] = None) -> bool:
+    # Квадрант хранится в БД и пересчитывается планировщиком по времени сервера,
+    # поэтому по умолчанию используются часы сервера, а не часовой пояс клиента
+    return deadline_is_urgent((clock or make_clock()).days_until(deadline_at))
+
+
+def determine_quadrant(is_important: bool, is_urgent: bool) -> str:
+    if is_important and is_urgent:
+        return "Q1"
+    elif is_important and not is_urgent:
+        return "Q2"
+    elif not is_important and is_urgent:
+        return "Q3"
+    else:
+        return "Q4"
+
+
+def urgency_expr(deadline_at, boundary: datetime):
+    return and_(deadline_at.isnot(None), deadline_at < boundary)
+
+
+def quadrant_expr(is_important, is_urgent):
+    """SQL-выражение квадранта; аргументы — столбцы, выражения или bool"""
+    if isinstance(is_important, bool):
+        is_important = true() if is_important else false()
+    if isinstance(is_urgent, bool):
+        is_urgent = true() if is_urgent else false()
+    return case(
+        (and_(is_important, is_urgent), "Q1"),
+        (is_important, "Q2"),
+        (is_urgent, "Q3"),
+        else_="Q4"
+    )
+
+
+def encode_cursor(task: Task) -> str:
+    raw = json.dumps([task.created_at.isoformat(), task.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(task_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор пагинации"
+        )
+
+
+def apply_task_scope(
+    query: Select,
+    current_user: User,
+    owner_id: Optional[int] = None,
+    user_id_column=Task.user_id,
+) -> Select:
+    # Администраторы видят все задачи (или задачи выбранного владельца),
+    # пользователи — только свои
+    if current_user.role.value == "admin":
+        if owner_id is not None:
+            query = query.where(user_id_column == owner_id)
+        return query
+    if owner_id is not None and owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Нет доступа к задачам другого пользователя"
+        )
+    return query.where(user_id_column == current_user.id)
+
+
+def apply_task_filters(query: Select, filters: TaskFilters) -> Select:
+    if filters.quadrant is not None:
+        query = query.where(Task.quadrant == filters.quadrant)
+    if filters.completed is not None:
+        query = query.where(Task.completed == filters.completed)
+    if filters.deadline_from is not None:
+        query = query.where(Task.deadline_at >= filters.deadline_from)
+    if filters.deadline_to is not None:
+        query = query.where(Task.deadline_at < filters.deadline_to)
+    return query
+
+
+def build_task_query(
+    current_user: User,
+    filters: TaskFilters,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    columns: Optional[list] = None,
+) -> Select:
+    """Один SQL-запрос со всеми фильтрами и keyset-пагинацией по (created_at, id).
+
+    columns — выбрать строки с этими столбцами вместо объектов Task.
+    """
+    query = apply_task_scope(select(*columns) if columns else select(Task), current_user, filters.owner_id)
+    query = apply_task_filters(query, filters)
+    if cursor is not None:
+        created_at, task_id = decode_cursor(cursor)
+        query = query.where(tuple_(Task.created_at, Task.id) > (created_at, task_id))
+    query = query.order_by(Task.created_at, Task.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def fetch_task_page(
+    db: AsyncSession,
+    current_user: User,
+    filters: TaskFilters,
+    cursor: Optional[str],
+    limit: int,
+    columns: Optional[list] = None,
+) -> Tuple[list, Optional[str]]:
+    # Запрашиваем на одну строку больше, чтобы узнать, есть ли следующая страница
+    result = await db.execute(build_task_query(current_user, filters, cursor, limit + 1, columns))
+    tasks = list(result.all() if columns else result.scalars().all())
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_cursor(tasks[-1])
+    return tasks, next_cursor
+
+
+async def fetch_task_fingerprint(
+    db: AsyncSession,
+    current_user: User,
+    filters: Optional[TaskFilters] = None,
+) -> Tuple[int, Optional[str]]:
+    """Количество задач и время последнего изменения — основа для ETag.
+
+    Удаление уменьшает количество, а создание и изменение сдвигают max(updated_at),
+    поэтому отпечаток меняется при любом изменении выборки.
+    """
+    filters = filters or TaskFilters()
+    query = apply_task_scope(
+        select(func.count(), func.max(Task.updated_at)),
+        current_user,
+        filters.owner_id,
+    )
+    count, last_updated = (await db.execute(apply_task_filters(query, filters))).one()
+    return count, last_updated.isoformat() if last_updated is not None else None
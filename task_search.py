@@ -0,0 +1,250 @@
+import html
+import os
+import re
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import event, func, literal_column, select, text, or_
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+from models.task import Task
+from models.user import User
+from task_queries import apply_task_scope
+
+load_dotenv()
+
+# Конфигурация полнотекстового поиска PostgreSQL (simple не зависит от языка)
+SEARCH_TS_CONFIG = os.getenv("SEARCH_TS_CONFIG", "simple")
+# postgres, memory или auto (выбор по диалекту БД)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+
+HIGHLIGHT_START = "<b>"
+HIGHLIGHT_STOP = "</b>"
+
+SearchHit = Tuple[Task, float, Optional[str]]
+
+# Столбец tsvector создается DDL-командой и не описан в модели,
+# чтобы схема оставалась совместимой с SQLite
+search_vector = literal_column("tasks.search_vector")
+ts_config = literal_column(f"'{SEARCH_TS_CONFIG}'::regconfig")
+
+_POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"""
+    ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('{SEARCH_TS_CONFIG}'::regconfig, coalesce(title, '') || ' ' || coalesce(description, ''))
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_tasks_search_vector ON tasks USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_tasks_title_trgm ON tasks USING GIN (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_tasks_description_trgm ON tasks USING GIN (description gin_trgm_ops)",
+]
+
+
+def _document(task_title: str, task_description: Optional[str]) -> str:
+    return f"{task_title} {task_description or ''}".strip()
+
+
+def _highlight_substring(document: str, q: str) -> Optional[str]:
+    # Подсветка для поиска по подстроке (в PostgreSQL для него нет ts_headline)
+    match = re.search(re.escape(q), document, re.IGNORECASE)
+    if match is None:
+        return None
+    start = max(0, match.start() - 60)
+    end = min(len(document), match.end() + 60)
+    return (
+        html.escape(document[start:match.start()])
+        + HIGHLIGHT_START + html.escape(match.group(0)) + HIGHLIGHT_STOP
+        + html.escape(document[match.end():end])
+    )
+
+
+def _html_escape_sql(value):
+    # ts_headline не экранирует текст, поэтому экранируем его до подсветки
+    for char, entity in (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;")):
+        value = func.replace(value, char, entity)
+    return value
+
+
+class PostgresSearchBackend:
+    """Поиск по GIN-индексу tsvector с запасным поиском подстроки по триграммам"""
+
+    async def search(self, db: AsyncSession, current_user: User, q: str, limit: int, offset: int) -> List[SearchHit]:
+        ts_query = func.websearch_to_tsquery(ts_config, q)
+        rank = func.ts_rank(search_vector, ts_query)
+        snippet = func.ts_headline(
+            ts_config,
+            _html_escape_sql(func.coalesce(Task.title, "") + " " + func.coalesce(Task.description, "")),
+            ts_query,
+            f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxFragments=2"
+        )
+        query = apply_task_scope(
+            select(Task, rank.label("rank"), snippet.label("snippet"))
+            .where(search_vector.op("@@")(ts_query)),
+            current_user,
+        ).order_by(rank.desc(), Task.id).limit(limit).offset(offset)
+        rows = (await db.execute(query)).all()
+        if rows or offset:
+            return [(row.Task, float(row.rank), row.snippet) for row in rows]
+
+        # Ни одного целого слова не найдено — ищем подстроку (ILIKE по триграммному индексу)
+        # Символы шаблона LIKE в запросе ищутся буквально
+        escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        keyword = f"%{escaped}%"
+        similarity = func.greatest(
+            func.similarity(Task.title, q),
+            func.similarity(func.coalesce(Task.description, ""), q)
+        )
+        query = apply_task_scope(
+            select(Task, similarity.label("rank"))
+            .where(or_(Task.title.ilike(keyword, escape="\\"), Task.description.ilike(keyword, escape="\\"))),
+            current_user,
+        ).order_by(similarity.desc(), Task.id).limit(limit)
+        rows = (await db.execute(query)).all()
+        return [
+            (row.Task, float(row.rank), _highlight_substring(_document(row.Task.title, row.Task.description), q))
+            for row in rows
+        ]
+
+
+class InMemorySearchBackend:
+    """Инвертированный индекс в памяти процесса для запусков на SQLite.
+
+    Индекс перестраивается целиком при первом поиске после любого изменения задач.
+    """
+
+    def __init__(self):
+        self._index: dict = {}
+        self._documents: dict = {}
+        self._generation = 0
+        self._indexed_generation = -1
+
+    @staticmethod
+    def tokenize(value: str) -> List[str]:
+        return re.findall(r"\w+", value.lower())
+
+    def mark_stale(self) -> None:
+        self._generation += 1
+
+    async def _rebuild(self, db: AsyncSession) -> None:
+        generation = self._generation
+        result = await db.execute(select(Task.id, Task.user_id, Task.title, Task.description))
+        index, documents = {}, {}
+        for task_id, user_id, title, description in result.all():
+            document = _document(title, description)
+            documents[task_id] = (user_id, document)
+            for token in self.tokenize(document):
+                index.setdefault(token, {}).setdefault(task_id, 0)
+                index[token][task_id] += 1
+        self._index, self._documents = index, documents
+        self._indexed_generation = generation
+
+    def _highlight_tokens(self, document: str, tokens: List[str]) -> str:
+        # Слова ищутся в исходном тексте, экранируется каждый фрагмент отдельно,
+        # иначе совпадение внутри сущности (&amp;) разбило бы ее
+        pattern = re.compile(r"\b(" + "|".join(re.escape(token) for token in tokens) + r")", re.IGNORECASE)
+        parts, position = [], 0
+        for match in pattern.finditer(document):
+            parts.append(html.escape(document[position:match.start()]))
+            parts.append(HIGHLIGHT_START + html.escape(match.group(0)) + HIGHLIGHT_STOP)
+            position = match.end()
+        parts.append(html.escape(document[position:]))
+        return "".join(parts)
+
+    async def search(self, db: AsyncSession, current_user: User, q: str, limit: int, offset: int) -> List[SearchHit]:
+        if self._indexed_generation != self._generation:
+            await self._rebuild(db)
+
+        def visible(task_id: int) -> bool:
+            return current_user.role.value == "admin" or self._documents[task_id][0] == current_user.id
+
+        tokens = self.tokenize(q)
+        scores: dict = {}
+        if tokens:
+            postings = [self._index.get(token, {}) for token in tokens]
+            for task_id in set.intersection(*(set(p) for p in postings)):
+                if visible(task_id):
+                    scores[task_id] = float(sum(p[task_id] for p in postings))
+        substring = not scores and offset == 0
+        if substring:
+            needle = q.lower()
+            scores = {
+                task_id: 1.0 for task_id, (_, document) in self._documents.items()
+                if needle in document.lower() and visible(task_id)
+            }
+        page = sorted(scores, key=lambda task_id: (-scores[task_id], task_id))[offset:offset + limit]
+        if not page:
+            return []
+
+        result = await db.execute(select(Task).where(Task.id.in_(page)))
+        tasks = {task.id: task for task in result.scalars().all()}
+        hits = []
+        for task_id in page:
+            if task_id not in tasks:
+                continue
+            document = self._documents[task_id][1]
+            snippet = _highlight_substring(document, q) if substring else self._highlight_tokens(document, tokens)
+            hits.append((tasks[task_id], scores[task_id], snippet))
+        return hits
+
+
+_backend = None
+
+
+def get_search_backend(engine: AsyncEngine):
+    global _backend
+    if _backend is None:
+        kind = SEARCH_BACKEND
+        if kind == "auto":
+            kind = "postgres" if engine.dialect.name == "postgresql" else "memory"
+        _backend = PostgresSearchBackend() if kind == "postgres" else InMemorySearchBackend()
+    return _backend
+
+
+async def init_search(engine: AsyncEngine) -> None:
+    # Столбец tsvector и GIN-индексы создаются только в PostgreSQL
+    if not isinstance(get_search_backend(engine), PostgresSearchBackend):
+        return
+    async with engine.begin() as conn:
+        for statement in _POSTGRES_SEARCH_DDL:
+            await conn.execute(text(statement))
+
+
+# Отслеживание изменений задач для индекса в памяти. Индекс помечается
+# устаревшим только после фиксации транзакции: поиск между flush и commit
+# перестроил бы индекс по старым данным и счел бы его актуальным
+_TASKS_CHANGED = "search_tasks_changed"
+
+
+def _mark_search_index_stale() -> None:
+    if isinstance(_backend, InMemorySearchBackend):
+        _backend.mark_stale()
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    if any(isinstance(obj, Task) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info[_TASKS_CHANGED] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_orm_execute(orm_execute_state):
+    if (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete) \
+            and orm_execute_state.bind_mapper is not None \
+            and orm_execute_state.bind_mapper.class_ is Task:
+        orm_execute_state.session.info[_TASKS_CHANGED] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    if session.info.pop(_TASKS_CHANGED, False):
+        _mark_search_index_stale()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _after_rollback(session, previous_transaction):
+    # Откат точки сохранения не отменяет изменений внешней транзакции
+    if previous_transaction.parent is None:
+        session.info.pop(_TASKS_CHANGED, None)
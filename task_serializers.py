@@ -0,0 +1,73 @@
+import json
+from datetime import date, datetime
+from operator import attrgetter
+from typing import Any, Iterable, List, Optional
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import Row
+
+from clock import Clock, current_clock
+from models.task import Task
+from task_queries import deadline_is_urgent
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Столбцы ответа TaskResponse. Списки выбираются из БД строками с этими
+# столбцами, без создания объектов Task и повторной проверки через Pydantic
+TASK_COLUMNS = [
+    Task.id,
+    Task.title,
+    Task.description,
+    Task.is_important,
+    Task.deadline_at,
+    Task.quadrant,
+    Task.completed,
+    Task.created_at,
+    Task.updated_at,
+    Task.completed_at,
+]
+_TASK_FIELDS = [column.key for column in TASK_COLUMNS]
+_task_values = attrgetter(*_TASK_FIELDS)
+
+
+def task_record(task, clock: Clock) -> dict:
+    """Готовый к JSON словарь задачи; task — строка с TASK_COLUMNS или объект Task"""
+    # Доступ к полям Row по имени заметно дороже, чем распаковка по позициям
+    values = task if isinstance(task, Row) else _task_values(task)
+    record = dict(zip(_TASK_FIELDS, values))
+    days_until_deadline = clock.days_until(record["deadline_at"])
+    record["is_urgent"] = deadline_is_urgent(days_until_deadline)
+    record["days_until_deadline"] = days_until_deadline
+    # Даты остаются объектами datetime: их кодирует dump_json
+    return record
+
+
+def task_records(tasks: Iterable, clock: Optional[Clock] = None) -> List[dict]:
+    # Часы запроса берутся один раз для всего ответа
+    clock = clock or current_clock()
+    return [task_record(task, clock) for task in tasks]
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dump_json(content: Any) -> bytes:
+    # orjson кодирует datetime в ISO 8601 так же, как isoformat()
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_json_default
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON-ответ через orjson (если установлен) без проверки по response_model"""
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
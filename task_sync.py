@@ -0,0 +1,138 @@
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from sqlalchemy import select, insert, delete, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models.task import Task
+from models.tombstone import TaskTombstone
+from models.user import User
+from sql_functions import change_horizon
+from task_queries import apply_task_scope
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Сколько хранятся записи об удаленных задачах. Токен синхронизации старше
+# этого срока недействителен: клиент должен выполнить полную синхронизацию.
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+TOMBSTONE_COMPACTION_SECONDS = int(os.getenv("TOMBSTONE_COMPACTION_SECONDS", "3600"))
+
+# Изменения упорядочены по (change_seq, вид записи, id);
+# при равном номере изменения задачи идут раньше удалений
+KIND_TASK = 0
+KIND_TOMBSTONE = 1
+
+SyncPosition = Tuple[int, int, int]
+
+
+def encode_sync_token(position: Optional[SyncPosition]) -> str:
+    raw = json.dumps([list(position) if position else None, int(time.time())]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_sync_token(token: str) -> Optional[SyncPosition]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        position, issued_at = json.loads(base64.urlsafe_b64decode(padded))
+        position = tuple(int(value) for value in position) if position is not None else None
+        if position is not None and len(position) != 3:
+            raise ValueError
+        issued_at = int(issued_at)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный токен синхронизации"
+        )
+    if issued_at < time.time() - TOMBSTONE_RETENTION_DAYS * 86400:
+        # Записи об удалениях за этот период могли быть уже очищены
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Токен синхронизации устарел, выполните полную синхронизацию"
+        )
+    return position
+
+
+async def fetch_changes(
+    db: AsyncSession,
+    current_user: User,
+    position: Optional[SyncPosition],
+    limit: int,
+) -> Tuple[List[Task], List[int], Optional[SyncPosition], bool]:
+    """Задачи, созданные или измененные после позиции, и id удаленных задач"""
+    # Граница вычисляется один раз: строки выше нее могут принадлежать
+    # незавершенным транзакциям и будут выданы при следующей синхронизации
+    horizon = (await db.execute(select(change_horizon()))).scalar()
+
+    tasks_query = apply_task_scope(select(Task).where(Task.change_seq < horizon), current_user)
+    tombstones_query = apply_task_scope(
+        select(TaskTombstone.change_seq, TaskTombstone.task_id).where(TaskTombstone.change_seq < horizon),
+        current_user,
+        user_id_column=TaskTombstone.user_id,
+    )
+    if position is not None:
+        change_seq, kind, item_id = position
+        if kind == KIND_TASK:
+            tasks_query = tasks_query.where(tuple_(Task.change_seq, Task.id) > (change_seq, item_id))
+            tombstones_query = tombstones_query.where(TaskTombstone.change_seq >= change_seq)
+        else:
+            tasks_query = tasks_query.where(Task.change_seq > change_seq)
+            tombstones_query = tombstones_query.where(
+                tuple_(TaskTombstone.change_seq, TaskTombstone.task_id) > (change_seq, item_id)
+            )
+
+    tasks = (await db.scalars(tasks_query.order_by(Task.change_seq, Task.id).limit(limit + 1))).all()
+    tombstones = (await db.execute(
+        tombstones_query.order_by(TaskTombstone.change_seq, TaskTombstone.task_id).limit(limit + 1)
+    )).all()
+
+    entries = sorted(
+        [(task.change_seq, KIND_TASK, task.id, task) for task in tasks]
+        + [(row.change_seq, KIND_TOMBSTONE, row.task_id, None) for row in tombstones],
+        key=lambda entry: entry[:3]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    next_position = tuple(entries[-1][:3]) if entries else position
+    changed = [entry[3] for entry in entries if entry[1] == KIND_TASK]
+    deleted = [entry[2] for entry in entries if entry[1] == KIND_TOMBSTONE]
+    return changed, deleted, next_position, has_more
+
+
+async def record_tombstones(db: AsyncSession, deleted_rows) -> None:
+    # Вызывается в той же транзакции, что и удаление задач
+    rows = [{"task_id": row.id, "user_id": row.user_id} for row in deleted_rows]
+    if rows:
+        await db.execute(insert(TaskTombstone), rows)
+
+
+async def purge_tombstones(now: Optional[datetime] = None) -> int:
+    """Удаляет записи об удалениях старше срока хранения"""
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(delete(TaskTombstone).where(TaskTombstone.deleted_at < cutoff))
+        await session.commit()
+    return result.rowcount
+
+
+async def run_tombstone_compaction(interval: int = TOMBSTONE_COMPACTION_SECONDS):
+    # Фоновая задача, запускаемая из lifespan приложения
+    while True:
+        try:
+            purged = await purge_tombstones()
+            if purged:
+                logger.info("Удалено устаревших записей об удалениях: %d", purged)
+        except Exception:
+            logger.exception("Ошибка очистки записей об удалениях")
+        await asyncio.sleep(interval)
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import os
+from typing import Dict
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from models.user import User
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Как часто воркер перечитывает версии токенов; столько же другие воркеры
+# могут принимать отозванный токен в режиме AUTH_STATELESS
+TOKEN_VERSION_REFRESH_SECONDS = int(os.getenv("TOKEN_VERSION_REFRESH_SECONDS", "30"))
+
+
+class TokenVersions:
+    """Версии токенов пользователей в памяти процесса.
+
+    Хранятся только ненулевые версии (пользователи, чьи токены отзывались),
+    поэтому словарь остается небольшим, а проверка токена — поиском в нем.
+    """
+
+    def __init__(self):
+        self._versions: Dict[int, int] = {}
+        # До первой загрузки проверка без БД невозможна
+        self.loaded = False
+
+    def get(self, user_id: int) -> int:
+        return self._versions.get(user_id, 0)
+
+    def set(self, user_id: int, version: int) -> None:
+        # Отзыв в этом воркере виден сразу, не дожидаясь обновления
+        if version > self._versions.get(user_id, 0):
+            self._versions[user_id] = version
+
+    async def refresh(self) -> None:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(User.id, User.token_version).where(User.token_version > 0)
+            )
+            versions = dict(result.all())
+        # Версии только растут: отзыв, сделанный во время запроса, не теряется
+        for user_id, version in self._versions.items():
+            if version > versions.get(user_id, 0):
+                versions[user_id] = version
+        self._versions = versions
+        self.loaded = True
+
+
+token_versions = TokenVersions()
+
+
+async def run_token_version_refresh(interval: int = TOKEN_VERSION_REFRESH_SECONDS):
+    # Фоновая задача, запускаемая из lifespan приложения
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await token_versions.refresh()
+        except Exception:
+            logger.exception("Ошибка обновления версий токенов")
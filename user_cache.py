@@ -0,0 +1,69 @@
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from cache_backends import create_cache_backend
+from models.user import User, UserRole
+
+load_dotenv()
+
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+
+class UserCache:
+    """Кэш данных аутентифицированного пользователя по его id"""
+
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"user:{user_id}"
+
+    async def get(self, user_id: int) -> Optional[User]:
+        data = await self.backend.get(self._key(user_id))
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Объект не привязан к сессии и не содержит хеш пароля
+        return User(
+            id=data["id"],
+            nickname=data["nickname"],
+            email=data["email"],
+            role=UserRole(data["role"]),
+            token_version=data.get("token_version", 0)
+        )
+
+    async def set(self, user: User) -> None:
+        await self.backend.set(
+            self._key(user.id),
+            {
+                "id": user.id,
+                "nickname": user.nickname,
+                "email": user.email,
+                "role": user.role.value,
+                "token_version": user.token_version
+            },
+            self.ttl
+        )
+
+    # Вызывается при смене пароля или роли пользователя
+    async def invalidate(self, user_id: int) -> None:
+        await self.backend.delete(self._key(user_id))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+user_cache = UserCache(create_cache_backend(USER_CACHE_MAX_ENTRIES), USER_CACHE_TTL_SECONDS)